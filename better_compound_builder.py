@@ -1,26 +1,142 @@
 from typing import Any
+from collections import OrderedDict, deque
+from functools import lru_cache, partial
+from itertools import accumulate, compress, islice
+from operator import add
+import argparse
+import codecs
+import json
+import sys
+from multiprocessing import Pool
+from os import cpu_count, getpid
+from time import perf_counter, time
+from contextlib import contextmanager
+import re
+import sqlite3
 
 
 QUANTITATIVE_PREFIXES = ["di", "tri", "tetra", "penta"]
-ALKANE_PREFIXES = ["met", "et", "prop", "but", "pent", "heks", "hept", "okt", "non", "dek"]
+BASIC_ALKANE_PREFIXES = ["met", "et", "prop", "but", "pent", "heks", "hept", "okt", "non", "dek"]
+
+# numerals of longer chains, put together from units, tens and hundreds
+NUMERAL_UNITS = ["", "hen", "do", "tri", "tetra", "penta", "heksa", "hepta", "okta", "nona"]
+NUMERAL_TENS = ["", "deka", "ejkoza", "triakonta", "tetrakonta", "pentakonta", "heksakonta", "heptakonta", "oktakonta", "nonakonta"]
+NUMERAL_HUNDREDS = ["", "hekta", "dikta", "trikta", "tetrakta", "pentakta", "heksakta", "heptakta", "oktakta", "nonakta"]
+MAX_COAL_AMOUNT = 999
 
 GROUPS_AND_SYMBOLS = {"bromo":"Br", "chloro":"Cl"}
 DASH = '-'
 
+# part of every persistent cache key, bump it whenever drawings change
+BUILDER_VERSION = "1"
+
 SINGLE_BOND = "-"
 DOUBLE_BOND = "="
 TRIPLE_BOND = "\u2261"
 
 SUBSCRIPT_2 = "\u2082"
 SUBSCRIPT_3 = "\u2083"
+SUBSCRIPT_4 = "\u2084"
 
 COAL = "C"
 HYDROGEN = "H"
+OXYGEN = "O"
+
+VALENCES = {COAL:4, OXYGEN:2, "Br":1, "Cl":1}
 
-ALKANE_GROUPS_AND_COAL_AMOUNTS = {"metylo":1, "propylo":3, "butylo":4, "pentylo":5}
+ALKANE_GROUPS_AND_COAL_AMOUNTS = {"metylo":1, "etylo":2, "propylo":3, "butylo":4, "pentylo":5}
 
 ALKANE_SUFFIXES_AND_BONDS = {"an":SINGLE_BOND, "en":DOUBLE_BOND, "yn":TRIPLE_BOND}
 
+BONDS_AND_ORDERS = {SINGLE_BOND:1, DOUBLE_BOND:2, TRIPLE_BOND:3}
+ORDERS_AND_BONDS = {1:SINGLE_BOND, 2:DOUBLE_BOND, 3:TRIPLE_BOND}
+
+# Groups, atoms and drawn cells are small integer codes from parsing up to
+# rendering. Group codes follow the alphabetical order of the group names,
+# so sorting codes sorts names. Hydroxyl is never a substituent and comes last.
+GROUP_NAMES = sorted(list(GROUPS_AND_SYMBOLS) + list(ALKANE_GROUPS_AND_COAL_AMOUNTS)) + ["ol"]
+GROUP_CODES = {group: code for code, group in enumerate(GROUP_NAMES)}
+HYDROXYL_GROUP = GROUP_CODES["ol"]
+
+ELEMENTS = [COAL, HYDROGEN, OXYGEN] + sorted(set(GROUPS_AND_SYMBOLS.values()))
+ELEMENT_CODES = {element: code for code, element in enumerate(ELEMENTS)}
+COAL_ATOM = ELEMENT_CODES[COAL]
+HYDROGEN_ATOM = ELEMENT_CODES[HYDROGEN]
+OXYGEN_ATOM = ELEMENT_CODES[OXYGEN]
+
+# Hill order: coal, hydrogen, then the other elements alphabetically
+FORMULA_ATOMS = [COAL_ATOM, HYDROGEN_ATOM] + sorted((code for code in range(len(ELEMENTS)) if code not in (COAL_ATOM, HYDROGEN_ATOM)), key=ELEMENTS.__getitem__)
+
+ELEMENT_VALENCES = [VALENCES.get(element, 0) for element in ELEMENTS]
+GROUP_ATOMS = [ELEMENT_CODES[GROUPS_AND_SYMBOLS[group]] if group in GROUPS_AND_SYMBOLS else None for group in GROUP_NAMES]
+GROUP_COAL_AMOUNTS = [ALKANE_GROUPS_AND_COAL_AMOUNTS.get(group, 0) for group in GROUP_NAMES]
+
+# A drawn cell is one byte: ascii glyphs keep their own code and the few
+# other glyphs get control codes, translated back only when rendering.
+GLYPHS_AND_CODES = {TRIPLE_BOND:1, SUBSCRIPT_2:2, SUBSCRIPT_3:3, SUBSCRIPT_4:4}
+
+def create_glyph_table():
+    glyphs = [chr(code) for code in range(128)]
+
+    for glyph, code in GLYPHS_AND_CODES.items():
+        glyphs[code] = glyph
+
+    return "".join(glyphs)
+
+# charmap tables, so both directions are a single pass in C
+CODES_TO_GLYPHS = create_glyph_table()
+GLYPHS_TO_CODES = codecs.charmap_build(CODES_TO_GLYPHS)
+
+def encode_glyphs(text):
+    return codecs.charmap_encode(text, "strict", GLYPHS_TO_CODES)[0]
+
+def decode_glyphs(cells):
+    return codecs.charmap_decode(cells, "strict", CODES_TO_GLYPHS)[0]
+
+def get_glyph_code(glyph):
+    return encode_glyphs(glyph)[0]
+
+BLANK_CODE = get_glyph_code(" ")
+COAL_CODE = get_glyph_code(COAL)
+HYDROGEN_CODE = get_glyph_code(HYDROGEN)
+VERTICAL_BOND_CODE = get_glyph_code("|")
+SINGLE_BOND_CODE = get_glyph_code(SINGLE_BOND)
+
+COAL_CELLS = encode_glyphs(COAL)
+# between the hydrogens of a coal and the next coal
+CHAIN_BOND_CELLS = encode_glyphs(f" {SINGLE_BOND}{SINGLE_BOND} ")
+
+SUBSCRIPT_CODES = {2:get_glyph_code(SUBSCRIPT_2), 3:get_glyph_code(SUBSCRIPT_3), 4:get_glyph_code(SUBSCRIPT_4)}
+ORDERS_AND_BOND_CODES = {order: get_glyph_code(bond) for order, bond in ORDERS_AND_BONDS.items()}
+
+# coals in one row of a drawing, longer chains are wrapped into bands
+CHAIN_BAND_COAL_AMOUNT = 10
+
+DIRECTIONS = ["up", "down", "left", "right"]
+UP, DOWN, LEFT, RIGHT = range(len(DIRECTIONS))
+# rows a group moves away from its coal per step of a longer bond
+DIRECTION_STEPS = [1, -1, 0, 0]
+
+def create_alkane_prefix(coal_amount):
+    if coal_amount <= len(BASIC_ALKANE_PREFIXES):
+        return BASIC_ALKANE_PREFIXES[coal_amount - 1]
+
+    units = NUMERAL_UNITS[coal_amount % 10]
+    tens = NUMERAL_TENS[coal_amount // 10 % 10]
+    hundreds = NUMERAL_HUNDREDS[coal_amount // 100]
+
+    # undekan, but henejkozan, and ejkoza loses its "ej" after a vowel
+    if coal_amount % 100 == 11:
+        units = "un"
+    elif tens.startswith("ej") and units[-1:] in ("a", "o", "i"):
+        tens = tens[2:]
+
+    # the last "a" of the numeral is dropped before "an", as in dekan
+    return (units + tens + hundreds)[:-1]
+
+ALKANE_PREFIXES = [create_alkane_prefix(coal_amount) for coal_amount in range(1, MAX_COAL_AMOUNT + 1)]
+ALKANE_PREFIXES_AND_COAL_AMOUNTS = {prefix: coal_amount for coal_amount, prefix in enumerate(ALKANE_PREFIXES, 1)}
+
 def get_symbol(group):
     return GROUPS_AND_SYMBOLS[group]
 
@@ -30,125 +146,928 @@ def alkane_group_to_coal_amount(alkane_group):
 def is_element(string):
     return string in GROUPS_AND_SYMBOLS
 
+def is_element_group(group):
+    return GROUP_ATOMS[group] is not None
+
 def alkane_prefix_to_coal_amount(alkane_prefix):
-    return ALKANE_PREFIXES.index(alkane_prefix) + 1
+    return ALKANE_PREFIXES_AND_COAL_AMOUNTS[alkane_prefix]
 
 def get_bond(alkane_suffix):
     return ALKANE_SUFFIXES_AND_BONDS[alkane_suffix]
 
-def remove_quantitative_prefix(segment: str) -> tuple[bool, str]:
-    for prefix in QUANTITATIVE_PREFIXES:
-        if segment.startswith(prefix):
-            return segment.removeprefix(prefix)
-    
-    return segment
+def words_to_pattern(words):
+    # A regex shaped like a trie over the words: every alternative starts
+    # with a different character, so matching never retries the vocabulary
+    # word by word and stays flat as the tables grow.
+
+    trie = {}
+
+    for word in words:
+        node = trie
+
+        for char in word:
+            node = node.setdefault(char, {})
+
+        node[""] = {}
+
+    return node_to_pattern(trie)
+
+def node_to_pattern(node):
+    branches = [re.escape(char) + node_to_pattern(child) for char, child in sorted(node.items()) if char != ""]
+
+    if not branches:
+        return ""
+
+    if len(branches) == 1 and "" not in node:
+        return branches[0]
+
+    pattern = "(?:" + "|".join(branches) + ")"
 
-class CompoundNameSplitter:
+    if "" in node:
+        pattern += "?"
+
+    return pattern
+
+def create_token_pattern():
+    multipliers = words_to_pattern(QUANTITATIVE_PREFIXES)
+    groups = words_to_pattern(list(GROUPS_AND_SYMBOLS) + list(ALKANE_GROUPS_AND_COAL_AMOUNTS))
+    alkanes = words_to_pattern(ALKANE_PREFIXES)
+    suffixes = words_to_pattern(ALKANE_SUFFIXES_AND_BONDS)
+
+    # A word takes the dash and the locants written before it in the same
+    # match, so a usual name needs one match per word. Locants and dashes
+    # which don't lead to a word are still matched alone.
+    return re.compile(
+        rf"{DASH}?(?:(?P<locants>\d+(?:,\d+)*){DASH}?)?(?:"
+        rf"(?P<substituent>(?P<multiplier>{multipliers})?(?P<group>{groups}))"
+        rf"|(?P<parent>(?P<alkane>{alkanes})(?P<alkane_suffix>an)?)"
+        rf"|(?P<suffix>{suffixes})"
+        rf"|(?P<hydroxyl>ol))"
+        rf"|(?P<lone_locants>\d+(?:,\d+)*)"
+        rf"|(?P<dash>{DASH})"
+        rf"|(?P<space>\s+)"
+    )
+
+TOKEN_PATTERN = create_token_pattern()
+
+class Substituent:
+    def __init__(self, locants, multiplier, group) -> None:
+        self.locants = locants
+        self.multiplier = multiplier
+        self.group = group
+
+class ParsedCompound:
+    def __init__(self) -> None:
+        self.substituents = []
+        self.main_alkane = None
+        self.bond_locant = None
+        self.alkane_suffix = None
+        self.hydroxyl_locant = None
+
+    def get_coal_amount(self):
+        return alkane_prefix_to_coal_amount(self.main_alkane)
+
+    def get_coal_index_of_alkane_bond(self):
+        return self.bond_locant
+
+    def get_bond_type(self):
+        return get_bond(self.alkane_suffix)
+
+    def get_hydroxyl_group_index(self):
+        return self.hydroxyl_locant
+
+    def has_hydroxyl_group(self):
+        return self.hydroxyl_locant is not None
+
+class CompoundNameParser:
     def __init__(self, compound_name) -> None:
         self.compound_name = compound_name
-        self.items = []
-        self.basic_group_items = []
-        self.main_group_items = []
+        self.parsed_compound = ParsedCompound()
+        self.locants = None
+
+    def parse(self):
+        position = 0
+
+        for match in iter(TOKEN_PATTERN.scanner(self.compound_name).match, None):
+            self.add_token(match)
+            position = match.end()
 
-    def split(self):
-        self.remove_space()
-        self.items = self.split_by_dash()
-        index, prefix = self.get_start_index_and_prefix_with_main_group()
+        if position < len(self.compound_name):
+            self.error_unknown_part(position)
 
-        if index == -1:
+        if self.locants is not None:
+            self.error_unused_locants()
+
+        if self.parsed_compound.main_alkane is None:
             self.error_compound_not_contains_main_alkane()
 
-        self.basic_group_items = self.items[:index]
-        self.main_group_items = self.items[(index + 1):]
+        if self.parsed_compound.alkane_suffix is None:
+            self.error_compound_not_contains_alkane_suffix()
+
+        return self.parsed_compound
+
+    def add_token(self, match):
+        locants = match["locants"] or match["lone_locants"]
+
+        if locants is not None:
+            if self.locants is not None:
+                self.error_unused_locants()
+
+            self.locants = [int(locant) for locant in locants.split(",")]
+
+        match(match.lastgroup):
+            case "substituent":
+                self.add_substituent(match)
+            case "parent":
+                self.add_main_alkane(match)
+            case "suffix":
+                if self.parsed_compound.alkane_suffix is not None:
+                    self.error_repeated_alkane_suffix()
+
+                self.parsed_compound.bond_locant = self.pop_locant()
+                self.parsed_compound.alkane_suffix = match["suffix"]
+            case "hydroxyl":
+                if self.parsed_compound.hydroxyl_locant is not None:
+                    self.error_repeated_hydroxyl_group()
+
+                self.parsed_compound.hydroxyl_locant = self.pop_locant()
+
+    def add_substituent(self, match):
+        # groups come before the main alkane
+        if self.parsed_compound.main_alkane is not None:
+            self.error_unknown_part(match.start("substituent"), match["substituent"])
 
-        main_alkane_group = self.items[index]
+        self.parsed_compound.substituents.append(Substituent(self.pop_locants(), match["multiplier"], GROUP_CODES[match["group"]]))
 
-        self.add_last_basic_group_and_first_main_group(main_alkane_group, prefix)
+    def add_main_alkane(self, match):
+        if self.parsed_compound.main_alkane is not None:
+            self.error_unknown_part(match.start("parent"), match["parent"])
 
-        return self.basic_group_items, self.main_group_items
+        self.parsed_compound.main_alkane = match["alkane"]
+
+        if match["alkane_suffix"] is not None:
+            self.parsed_compound.bond_locant = 1
+            self.parsed_compound.alkane_suffix = match["alkane_suffix"]
+
+    def pop_locants(self):
+        locants = self.locants
+
+        if locants is None:
+            self.error_missing_locants()
+
+        self.locants = None
+
+        return locants
+
+    def pop_locant(self):
+        # a bond or a hydroxyl group is on one coal
+        locants = self.pop_locants()
+
+        if len(locants) > 1:
+            self.error_more_than_one_locant()
+
+        return locants[0]
 
     def error_compound_not_contains_main_alkane(self):
         raise ValueError("The compound doesn't contain main alkane!")
 
-    def add_last_basic_group_and_first_main_group(self, main_alkane_group: str, prefix):
-        last_basic_group = main_alkane_group.removesuffix("an").removesuffix(prefix)
-        self.basic_group_items.append(last_basic_group)
+    def error_compound_not_contains_alkane_suffix(self):
+        raise ValueError("The compound doesn't contain alkane suffix!")
+
+    def error_missing_locants(self):
+        raise ValueError("The compound contains a group without coal indexes!")
 
-        # adding first main group   
+    def error_unused_locants(self):
+        raise ValueError("The compound contains coal indexes which don't belong to any group!")
 
-        if main_alkane_group.endswith("an"):
-            self.main_group_items.insert(0, "an")
-            self.main_group_items.insert(0, "1")
+    def error_repeated_alkane_suffix(self):
+        raise ValueError("The compound contains more than one alkane suffix!")
+
+    def error_repeated_hydroxyl_group(self):
+        raise ValueError("The compound contains more than one hydroxyl group!")
+
+    def error_more_than_one_locant(self):
+        raise ValueError("The compound contains a bond or hydroxyl group with more than one coal index!")
+
+    def error_unknown_part(self, position, part=None):
+        if part is None:
+            part = self.compound_name[position:]
+
+        raise ValueError(f"The compound contains an unknown part at position {position}: '{part}'!")
+
+class Molecule:
+    # Atoms and bonds are kept in parallel lists. The first coal_amount
+    # atoms are the main chain and the first coal_amount - 1 bonds join
+    # them, so the chain needs no extra index lists.
+
+    __slots__ = (
+        "elements", "bond_order_sums", "hydrogen_amounts",
+        "bond_starts", "bond_ends", "bond_orders",
+        "coal_amount", "coal_indexed_groups"
+    )
+
+    def __init__(self) -> None:
+        self.elements = bytearray()
+        self.bond_order_sums = []
+        self.hydrogen_amounts = []
+
+        self.bond_starts = []
+        self.bond_ends = []
+        self.bond_orders = []
+
+        self.coal_amount = 0
+        self.coal_indexed_groups = []
+
+    def add_atom(self, element):
+        self.elements.append(element)
+        self.bond_order_sums.append(0)
+
+        return len(self.elements) - 1
+
+    def add_bond(self, start, end, order=1):
+        self.bond_starts.append(start)
+        self.bond_ends.append(end)
+        self.bond_orders.append(order)
+
+        self.bond_order_sums[start] += order
+        self.bond_order_sums[end] += order
+
+    def set_bond_order(self, bond, order):
+        difference = order - self.bond_orders[bond]
+
+        self.bond_orders[bond] = order
+        self.bond_order_sums[self.bond_starts[bond]] += difference
+        self.bond_order_sums[self.bond_ends[bond]] += difference
+
+    def get_chain_hydrogen_amounts(self):
+        return self.hydrogen_amounts[:self.coal_amount]
+
+    def get_chain_bond_orders(self):
+        return self.bond_orders[:(self.coal_amount - 1)]
+
+    def get_atom_counts(self):
+        atom_counts = {}
+
+        for element in self.elements:
+            atom_counts[ELEMENTS[element]] = atom_counts.get(ELEMENTS[element], 0) + 1
+
+        hydrogen_amount = sum(self.hydrogen_amounts)
+
+        if hydrogen_amount:
+            atom_counts[HYDROGEN] = hydrogen_amount
+
+        return atom_counts
+
+class MoleculeBuilder:
+    def __init__(self, parsed_compound) -> None:
+        self.parsed_compound = parsed_compound
+        self.molecule = Molecule()
+
+    def build(self):
+        coal_amount = self.parsed_compound.get_coal_amount()
+        chain_hydrogen_amounts = count_chain_hydrogen_amounts(self.parsed_compound)
+
+        if not are_all_numbers_positive_or_equal_to_zero(chain_hydrogen_amounts):
+            more_than_4_coal_connections_error()
+
+        self.build_chain(coal_amount)
+        self.build_alkane_bond(coal_amount)
+
+        coal_indexed_groups = to_coal_indexed_lists_of_groups(self.parsed_compound.substituents, coal_amount)
+
+        if self.parsed_compound.has_hydroxyl_group():
+            coal_indexed_groups[self.parsed_compound.get_hydroxyl_group_index() - 1].append(HYDROXYL_GROUP)
+
+        for coal, groups in enumerate(coal_indexed_groups):
+            for group in groups:
+                self.build_group(coal, group)
+
+        self.molecule.coal_indexed_groups = coal_indexed_groups
+        self.molecule.hydrogen_amounts = chain_hydrogen_amounts + self.count_group_hydrogen_amounts(coal_amount)
+
+        return self.molecule
+
+    def count_group_hydrogen_amounts(self, first_atom):
+        return [
+            ELEMENT_VALENCES[element] - bond_order_sum
+            for element, bond_order_sum in zip(self.molecule.elements[first_atom:], self.molecule.bond_order_sums[first_atom:])
+        ]
+
+    def build_chain(self, coal_amount):
+        self.molecule.coal_amount = coal_amount
+
+        for _ in range(coal_amount):
+            self.molecule.add_atom(COAL_ATOM)
+
+        for coal in range(coal_amount - 1):
+            self.molecule.add_bond(coal, coal + 1)
+
+    def build_alkane_bond(self, coal_amount):
+        bond_index, bond_type = get_alkane_bond(self.parsed_compound, coal_amount)
+
+        if bond_type != SINGLE_BOND:
+            self.molecule.set_bond_order(bond_index, BONDS_AND_ORDERS[bond_type])
+
+    def build_group(self, coal, group):
+        if is_element_group(group):
+            self.molecule.add_bond(coal, self.molecule.add_atom(GROUP_ATOMS[group]))
+        elif group == HYDROXYL_GROUP:
+            self.molecule.add_bond(coal, self.molecule.add_atom(OXYGEN_ATOM))
+        else:
+            previous_atom = coal
+
+            for _ in range(GROUP_COAL_AMOUNTS[group]):
+                atom = self.molecule.add_atom(COAL_ATOM)
+                self.molecule.add_bond(previous_atom, atom)
+                previous_atom = atom
+
+def get_multiplier(group_amount):
+    index = group_amount - 2
+
+    if 0 <= index < len(QUANTITATIVE_PREFIXES):
+        return QUANTITATIVE_PREFIXES[index]
+
+    return None
+
+def canonicalize_parsed_compound(parsed_compound):
+    # Equivalent names end up with one form: every group listed once,
+    # groups in alphabetical order (multipliers are ignored, as in IUPAC
+    # names), sorted locants and a multiplier matching their amount.
+
+    groups_and_locants = {}
+
+    for substituent in parsed_compound.substituents:
+        groups_and_locants.setdefault(substituent.group, []).extend(substituent.locants)
+
+    canonical_compound = ParsedCompound()
+
+    for group in sorted(groups_and_locants):
+        locants = sorted(groups_and_locants[group])
+        canonical_compound.substituents.append(Substituent(locants, get_multiplier(len(locants)), group))
+
+    canonical_compound.main_alkane = parsed_compound.main_alkane
+    canonical_compound.alkane_suffix = parsed_compound.alkane_suffix
+    canonical_compound.hydroxyl_locant = parsed_compound.hydroxyl_locant
+
+    # the locant of a single bond changes nothing
+    if parsed_compound.alkane_suffix == "an":
+        canonical_compound.bond_locant = 1
+    else:
+        canonical_compound.bond_locant = parsed_compound.bond_locant
+
+    return canonical_compound
+
+def format_compound_name(parsed_compound):
+    parts = [
+        ",".join(str(locant) for locant in substituent.locants) + DASH + (substituent.multiplier or "") + GROUP_NAMES[substituent.group]
+        for substituent in parsed_compound.substituents
+    ]
+
+    main_alkane = parsed_compound.main_alkane
+
+    if parsed_compound.alkane_suffix == "an" and parsed_compound.bond_locant == 1:
+        main_alkane += "an"
+    else:
+        main_alkane += f"{DASH}{parsed_compound.bond_locant}{DASH}{parsed_compound.alkane_suffix}"
+
+    if parsed_compound.has_hydroxyl_group():
+        main_alkane += f"{DASH}{parsed_compound.hydroxyl_locant}{DASH}ol"
+
+    return DASH.join(parts) + main_alkane
+
+def canonicalize_compound_name(compound_name):
+    return format_compound_name(canonicalize_parsed_compound(CompoundNameParser(compound_name).parse()))
+
+def get_canonical_name(parsed_compound):
+    # the key equivalent names share in caches and batches, the drawing
+    # itself keeps the groups in the order they were written
+    canonical_name = format_compound_name(canonicalize_parsed_compound(parsed_compound))
+
+    if render_profile is not None:
+        render_profile.end_phase("canonicalize")
+
+    return canonical_name
+
+def build_molecule(compound_name):
+    return build_parsed_molecule(parse_compound_name(compound_name))
+
+def parse_compound_name(compound_name):
+    profile = render_profile
+
+    if profile is not None:
+        profile.start()
+
+    parsed_compound = CompoundNameParser(compound_name).parse()
+
+    if profile is not None:
+        profile.end_phase("parse")
+
+    return parsed_compound
+
+def build_parsed_molecule(parsed_compound):
+    profile = render_profile
+    molecule = MoleculeBuilder(parsed_compound).build()
+
+    if profile is not None:
+        profile.end_phase("build")
+
+    return molecule
+
+def get_alkane_bond(parsed_compound, coal_amount):
+    bond_index = parsed_compound.get_coal_index_of_alkane_bond() - 1
+    bond_type = parsed_compound.get_bond_type()
+
+    # a double or triple bond needs the next coal as well
+    last_bond_index = coal_amount - 1 if bond_type == SINGLE_BOND else coal_amount - 2
+
+    if not 0 <= bond_index <= last_bond_index:
+        wrong_coal_index_of_bond_error()
 
-        self.main_group_items.insert(0, prefix)
+    return bond_index, bond_type
 
-    def remove_space(self):
-        self.compound_name.replace(" ", "")
+def get_chain_hydrogen_amounts(coal_amount):
+    # hydrogens of every chain coal before any group or multiple bond
+    return [4 - (coal > 0) - (coal < coal_amount - 1) for coal in range(coal_amount)]
 
-    def split_by_dash(self):
-        return self.compound_name.split(DASH)
+def count_chain_hydrogen_amounts(parsed_compound):
+    # The hydrogens left on every chain coal once the alkane bond and the
+    # groups take their places, shared by the Molecule and the formula.
+    # Out of range locants raise, a negative amount is left to the caller.
 
-    def get_start_index_and_prefix_with_main_group(self):
-        for i in range(len(self.items) - 1, -1, -1):
-            item_with_alkane_suffix = self.items[i]
-            item_without_suffix_an = self.items[i].removesuffix("an")
+    coal_amount = parsed_compound.get_coal_amount()
+    bond_index, bond_type = get_alkane_bond(parsed_compound, coal_amount)
 
-            for prefix in ALKANE_PREFIXES:
-                if item_with_alkane_suffix.endswith(prefix) or item_without_suffix_an.endswith(prefix):
-                    return i, prefix
-                
-        return -1, None
+    hydrogen_amounts = get_chain_hydrogen_amounts(coal_amount)
+
+    if bond_type != SINGLE_BOND:
+        extra_bond_order = BONDS_AND_ORDERS[bond_type] - 1
+
+        hydrogen_amounts[bond_index] -= extra_bond_order
+        hydrogen_amounts[bond_index + 1] -= extra_bond_order
+
+    for substituent in parsed_compound.substituents:
+        for locant in substituent.locants:
+            if not 1 <= locant <= coal_amount:
+                wrong_coal_index_of_group_error()
+
+            hydrogen_amounts[locant - 1] -= 1
+
+    if parsed_compound.has_hydroxyl_group():
+        hydroxyl_group_index = parsed_compound.get_hydroxyl_group_index()
+
+        if not 1 <= hydroxyl_group_index <= coal_amount:
+            wrong_coal_index_of_group_error()
+
+        hydrogen_amounts[hydroxyl_group_index - 1] -= 1
+
+    return hydrogen_amounts
+
+def count_group_atoms(group):
+    # the atoms a group adds to a molecule, hydrogens included, as pairs of
+    # an element code and an amount, read from the group built on a lone coal
+    builder = MoleculeBuilder(None)
+    builder.molecule.add_atom(COAL_ATOM)
+    builder.build_group(0, group)
+
+    atom_counts = [0] * len(ELEMENTS)
+
+    for element in builder.molecule.elements[1:]:
+        atom_counts[element] += 1
+
+    atom_counts[HYDROGEN_ATOM] += sum(builder.count_group_hydrogen_amounts(1))
+
+    return tuple((element, atom_amount) for element, atom_amount in enumerate(atom_counts) if atom_amount)
+
+GROUP_ATOM_COUNTS = [count_group_atoms(group) for group in range(len(GROUP_NAMES))]
+
+def format_formula(atom_counts):
+    formula = ""
+
+    for element in FORMULA_ATOMS:
+        atom_amount = atom_counts[element]
+
+        if atom_amount == 1:
+            formula += ELEMENTS[element]
+        elif atom_amount > 1:
+            formula += ELEMENTS[element] + str(atom_amount)
+
+    return formula
+
+@lru_cache(maxsize=1024)
+def interprate_compound_formula(compound_name):
+    # The formula and the valence check from the parsed name alone, no
+    # atoms are built and nothing is drawn. Results are kept by name, as
+    # the same names come back again and again, names which raise are not.
+
+    parsed_compound = CompoundNameParser(compound_name).parse()
+    hydrogen_amounts = count_chain_hydrogen_amounts(parsed_compound)
+
+    if not are_all_numbers_positive_or_equal_to_zero(hydrogen_amounts):
+        return None, False
+
+    atom_counts = [0] * len(ELEMENTS)
+    atom_counts[COAL_ATOM] = len(hydrogen_amounts)
+    atom_counts[HYDROGEN_ATOM] = sum(hydrogen_amounts)
+
+    for substituent in parsed_compound.substituents:
+        group_amount = len(substituent.locants)
+
+        for element, atom_amount in GROUP_ATOM_COUNTS[substituent.group]:
+            atom_counts[element] += atom_amount * group_amount
+
+    if parsed_compound.has_hydroxyl_group():
+        for element, atom_amount in GROUP_ATOM_COUNTS[HYDROXYL_GROUP]:
+            atom_counts[element] += atom_amount
+
+    return format_formula(atom_counts), True
+
+PROFILE_COUNTERS = ["compounds", "growth_events", "cursor_moves", "cells_written"]
+
+class RenderProfile:
+    # Wall time per phase and counters of canvas work, filled while it is
+    # the active profile of profile_rendering. Phases are timed as laps:
+    # start() begins one and end_phase() charges the time since to a phase.
+    # on_phase, when given, is called with every finished phase and its
+    # seconds.
+
+    def __init__(self, on_phase=None) -> None:
+        self.on_phase = on_phase
+        self.phase_seconds = {}
+        self.phase_calls = {}
+        self.counters = dict.fromkeys(PROFILE_COUNTERS, 0)
+        self.lap_start = perf_counter()
+
+    def __getstate__(self):
+        # profiles come back from worker processes, callbacks stay behind
+        state = self.__dict__.copy()
+        state["on_phase"] = None
+
+        return state
+
+    def start(self):
+        self.lap_start = perf_counter()
+
+    def end_phase(self, phase):
+        now = perf_counter()
+        self.add_time(phase, now - self.lap_start)
+        self.lap_start = now
+
+    def add_time(self, phase, seconds):
+        self.phase_seconds[phase] = self.phase_seconds.get(phase, 0) + seconds
+        self.phase_calls[phase] = self.phase_calls.get(phase, 0) + 1
+
+        if self.on_phase is not None:
+            self.on_phase(phase, seconds)
+
+    def count(self, counter, amount=1):
+        self.counters[counter] += amount
+
+    def merge(self, profile):
+        for phase, seconds in profile.phase_seconds.items():
+            self.phase_seconds[phase] = self.phase_seconds.get(phase, 0) + seconds
+            self.phase_calls[phase] = self.phase_calls.get(phase, 0) + profile.phase_calls[phase]
+
+        for counter, amount in profile.counters.items():
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def get_summary(self):
+        return {
+            "phases": {
+                phase: {"seconds": seconds, "calls": self.phase_calls[phase]}
+                for phase, seconds in self.phase_seconds.items()
+            },
+            "counters": dict(self.counters)
+        }
+
+    def format_summary(self):
+        total_seconds = sum(self.phase_seconds.values()) or 1
+        lines = []
+
+        for phase, seconds in sorted(self.phase_seconds.items(), key=lambda item: -item[1]):
+            lines.append(f"{phase:>12}: {seconds * 1e3:10.3f} ms {self.phase_calls[phase]:8} calls {seconds / total_seconds:6.1%}")
+
+        for counter, amount in self.counters.items():
+            lines.append(f"{counter:>12}: {amount}")
+
+        return "\n".join(lines)
+
+# checked with "is not None" on the hot paths, so profiling costs nothing
+# noticeable while it is off
+render_profile = None
+
+@contextmanager
+def profile_rendering(profile=None):
+    global render_profile
+
+    previous_profile = render_profile
+    render_profile = RenderProfile() if profile is None else profile
+
+    try:
+        yield render_profile
+    finally:
+        render_profile = previous_profile
+
+def run_profiled(function, *arguments):
+    # for worker processes, which send their own profile back to be merged
+    with profile_rendering() as profile:
+        return function(*arguments), profile
 
 class Matrix:
-    def __init__(self, height, length, default_item):
+    # Coordinates are logical and may be negative. Rows and columns are
+    # allocated around an origin with spare room on every side, so growing
+    # in any direction only moves the used bounds and the storage is
+    # doubled when it runs out, instead of shifting every stored coordinate.
+
+    def __init__(self, height, length, default_item, min_x=0, min_y=0):
         self.height = height
         self.length = length
         self.default_item = default_item
+
+        self.min_x = min_x
+        self.min_y = min_y
+
+        self.origin_x = -min_x
+        self.origin_y = -min_y
+        self.capacity_x = length
+
         self.items = self.create_items()
+        # storage index just after the last written cell of every row, used
+        # to trim trailing empty cells while rendering
+        self.row_ends = [0] * self.height
+
+    def max_x(self):
+        return self.min_x + self.length - 1
+
+    def max_y(self):
+        return self.min_y + self.height - 1
 
     def get_row(self, y):
-        return self.items[y]
+        start = self.origin_x + self.min_x
+        return self.items[y + self.origin_y][start:(start + self.length)]
+
+    def get_rows(self):
+        start = self.origin_x + self.min_x
+        end = start + self.length
+        lower = self.origin_y + self.min_y
+
+        return [row[start:end] for row in self.items[lower:(lower + self.height)]]
 
     def create_items(self):
         return [self.create_row() for _ in range(self.height)]
 
     def create_row(self):
-        return [self.default_item for _ in range(self.length)]
+        return bytearray((self.default_item,)) * self.capacity_x
 
     def set(self, x, y, item):
-        self.items[y][x] = item
+        row_index = y + self.origin_y
+        index = x + self.origin_x
+
+        self.items[row_index][index] = item
+
+        if item != self.default_item and index >= self.row_ends[row_index]:
+            self.row_ends[row_index] = index + 1
+
+        if render_profile is not None:
+            render_profile.count("cells_written")
 
     def get(self, x, y):
-        return self.items[y][x]
+        return self.items[y + self.origin_y][x + self.origin_x]
+
+    def write(self, x, y, cells):
+        row_index = y + self.origin_y
+        start = x + self.origin_x
+        end = start + len(cells)
+
+        self.items[row_index][start:end] = cells
+
+        if end > self.row_ends[row_index]:
+            self.row_ends[row_index] = end
+
+        if render_profile is not None:
+            render_profile.count("cells_written", len(cells))
+
+    def erase(self, x, y, length):
+        row_index = y + self.origin_y
+        start = x + self.origin_x
+        end = start + length
+        row = self.items[row_index]
+        blank = bytes((self.default_item,))
+
+        row[start:end] = blank * length
+
+        # the row may now end earlier, look back for its last written cell
+        if end >= self.row_ends[row_index]:
+            self.row_ends[row_index] = len(row[:start].rstrip(blank))
 
     def remove_column(self, x):
-        for row in self.items:
-            row.pop(x)
+        index = x + self.origin_x
+
+        for row_index, row in enumerate(self.items):
+            del row[index]
+
+            if index < self.row_ends[row_index]:
+                self.row_ends[row_index] -= 1
+
+        self.capacity_x -= 1
+        self.length -= 1
+
+    def insert_columns(self, x, amount):
+        # empty columns before x, everything from x on moves right
+        index = x + self.origin_x
+        padding = bytes((self.default_item,)) * amount
+
+        for row_index, row in enumerate(self.items):
+            row[index:index] = padding
+
+            if index < self.row_ends[row_index]:
+                self.row_ends[row_index] += amount
+
+        self.capacity_x += amount
+        self.length += amount
+
+    def remove_columns(self, x, amount):
+        index = x + self.origin_x
+        blank = bytes((self.default_item,))
+
+        for row_index, row in enumerate(self.items):
+            del row[index:(index + amount)]
+
+            if index + amount < self.row_ends[row_index]:
+                self.row_ends[row_index] -= amount
+            elif index < self.row_ends[row_index]:
+                self.row_ends[row_index] = len(row[:index].rstrip(blank))
+
+        self.capacity_x -= amount
+        self.length -= amount
+
+    def is_area_empty(self, min_x, max_x, min_y, max_y):
+        start = min_x + self.origin_x
+        end = max_x + self.origin_x + 1
+
+        for row in self.items[(min_y + self.origin_y):(max_y + self.origin_y + 1)]:
+            if row.count(self.default_item, start, end) != end - start:
+                return False
+
+        return True
+
+    def remove_empty_columns(self):
+        # One sweep over the used cells marks the occupied columns, then
+        # every row is rebuilt once with tight storage around the origin. A
+        # run of empty columns between drawn cells keeps one column, so the
+        # spaces around bonds stay, and empty columns at the edges go.
+        start = self.origin_x + self.min_x
+        lower = self.origin_y + self.min_y
+        rows = [row[start:(start + self.length)] for row in self.items[lower:(lower + self.height)]]
+        row_ends = [min(max(row_end - start, 0), self.length) for row_end in self.row_ends[lower:(lower + self.height)]]
+
+        # cells as 0 and 1 bytes, or-ed together as integers without carries
+        occupied_table = bytes(int(code != self.default_item) for code in range(256))
+        occupied = 0
+
+        for row in rows:
+            occupied |= int.from_bytes(row.translate(occupied_table), "big")
+
+        occupied = occupied.to_bytes(self.length, "big")
+        last_occupied = occupied.rfind(1)
+
+        kept = bytes(
+            int(is_occupied or (0 < x < last_occupied and occupied[x - 1]))
+            for x, is_occupied in enumerate(occupied)
+        )
+        kept_before = list(accumulate(kept, initial=0))
+
+        self.items = [bytearray(compress(row, kept)) for row in rows]
+        self.row_ends = [kept_before[row_end] for row_end in row_ends]
+
+        self.length = kept_before[-1]
+        self.capacity_x = self.length
+        self.origin_x = -self.min_x
+        self.origin_y = -self.min_y
+
+    def set_bounds(self, min_x, max_x, min_y, max_y):
+        # the used bounds become exactly these, the cells left outside them
+        # have to be empty already
+        self.expand_to(min_x, min_y)
+        self.expand_to(max_x, max_y)
+
+        self.min_x = min_x
+        self.min_y = min_y
+        self.length = max_x - min_x + 1
+        self.height = max_y - min_y + 1
+
+    def reserve_right_columns(self, amount):
+        padding = bytes((self.default_item,)) * amount
 
-    def add_right_column(self):
         for row in self.items:
-            row.append(self.default_item)
-        
-        self.length += 1
+            row.extend(padding)
+
+        self.capacity_x += amount
+
+    def reserve_left_columns(self, amount):
+        padding = bytes((self.default_item,)) * amount
 
-    def add_left_column(self):
         for row in self.items:
-            row.insert(0, self.default_item)
+            row[0:0] = padding
+
+        self.row_ends = [row_end + amount if row_end else 0 for row_end in self.row_ends]
+
+        self.origin_x += amount
+        self.capacity_x += amount
+
+    def reserve_upper_rows(self, amount):
+        self.items.extend(self.create_row() for _ in range(amount))
+        self.row_ends.extend([0] * amount)
+
+    def reserve_lower_rows(self, amount):
+        self.items[0:0] = [self.create_row() for _ in range(amount)]
+        self.row_ends[0:0] = [0] * amount
+        self.origin_y += amount
+
+    def expand_to(self, x, y):
+        # storage is at least doubled on the side that runs out of room,
+        # so any sequence of expansions costs O(1) amortized per cell
+
+        if render_profile is not None and not (self.min_x <= x <= self.max_x() and self.min_y <= y <= self.max_y()):
+            render_profile.count("growth_events")
+
+        if x > self.max_x():
+            missing = self.origin_x + x + 1 - self.capacity_x
+
+            if missing > 0:
+                self.reserve_right_columns(max(missing, self.capacity_x))
+
+            self.length = x - self.min_x + 1
+        elif x < self.min_x:
+            missing = -(self.origin_x + x)
+
+            if missing > 0:
+                self.reserve_left_columns(max(missing, self.capacity_x))
+
+            self.length += self.min_x - x
+            self.min_x = x
+
+        if y > self.max_y():
+            missing = self.origin_y + y + 1 - len(self.items)
+
+            if missing > 0:
+                self.reserve_upper_rows(max(missing, len(self.items)))
+
+            self.height = y - self.min_y + 1
+        elif y < self.min_y:
+            missing = -(self.origin_y + y)
 
-        self.length += 1
+            if missing > 0:
+                self.reserve_lower_rows(max(missing, len(self.items)))
+
+            self.height += self.min_y - y
+            self.min_y = y
+
+    def add_right_column(self):
+        self.expand_to(self.max_x() + 1, self.min_y)
+
+    def add_left_column(self):
+        self.expand_to(self.min_x - 1, self.min_y)
 
     def add_upper_row(self):
-        self.items.append(self.create_row())
-        self.height += 1
+        self.expand_to(self.min_x, self.max_y() + 1)
 
     def add_lower_row(self):
-        self.items.insert(0, self.create_row())
-        self.height += 1
+        self.expand_to(self.min_x, self.min_y - 1)
+
+    def to_rows(self):
+        return tuple(decode_glyphs(row) for row in self.get_rows())
+
+    def render(self, encoding=None):
+        # one string for the whole matrix, each row cut at its last written
+        # cell while it is joined and the codes translated to glyphs once
+        profile = render_profile
+
+        if profile is not None:
+            render_start = perf_counter()
+
+        start = self.origin_x + self.min_x
+        end = start + self.length
+        lower = self.origin_y + self.min_y
+        upper = lower + self.height
+
+        text = decode_glyphs(b"\n".join(
+            row[start:min(row_end, end)]
+            for row, row_end in zip(self.items[lower:upper], self.row_ends[lower:upper])
+        ))
+
+        if profile is not None:
+            profile.add_time("render", perf_counter() - render_start)
+
+        if encoding is None:
+            return text
+
+        return text.encode(encoding)
+
+    def write_to(self, stream):
+        stream.write(self.render() + "\n")
 
     def print(self):
-        for row in self.items:
-            string = "".join(row)
-            print(string)
+        print(self.render())
 
 class MatrixIterator:
     def __init__(self, matrix: Matrix, start_x=0, start_y=0) -> None:
@@ -158,27 +1077,15 @@ class MatrixIterator:
         self.current_y = start_y
 
     def move_to_coordinates(self, x, y):
-        # diff_x (+) -> right
-        # diff_x (-) -> left
-        # diff_y (+) -> up
-        # diff_y (-) -> down
-
-        diff_x = x - self.current_x
-        diff_y = y - self.current_y
-
-        if diff_x > 0:
-            for _ in range(abs(diff_x)):
-                self.move_right()            
-        elif diff_x < 0:
-            for _ in range(abs(diff_x)):
-                self.move_left()           
-
-        if diff_y > 0:
-            for _ in range(abs(diff_y)):
-                self.move_up()         
-        elif diff_y < 0:
-            for _ in range(abs(diff_y)):
-                self.move_down()  
+        # every cell on the way lies inside the box spanned by the current
+        # position and the target, so covering the target is enough
+        self.matrix.expand_to(x, y)
+
+        self.current_x = x
+        self.current_y = y
+
+        if render_profile is not None:
+            render_profile.count("cursor_moves")
 
     def move_right(self):
         if self.is_x_too_big(self.current_x + 1):
@@ -186,11 +1093,17 @@ class MatrixIterator:
 
         self.current_x += 1
 
+        if render_profile is not None:
+            render_profile.count("cursor_moves")
+
     def move_left(self):
         if self.is_x_too_small(self.current_x - 1):
             self.matrix.add_left_column()
-        else:
-            self.current_x -= 1
+
+        self.current_x -= 1
+
+        if render_profile is not None:
+            render_profile.count("cursor_moves")
 
     def move_up(self):
         if self.is_y_too_big(self.current_y + 1):
@@ -198,109 +1111,112 @@ class MatrixIterator:
         
         self.current_y += 1
 
+        if render_profile is not None:
+            render_profile.count("cursor_moves")
+
     def move_down(self):
         if self.is_y_too_small(self.current_y - 1):
             self.matrix.add_lower_row()
-        else:
-            self.current_y -= 1
+
+        self.current_y -= 1
+
+        if render_profile is not None:
+            render_profile.count("cursor_moves")
 
     def is_x_too_big(self, x):
-        return x >= self.matrix.length
+        return x > self.matrix.max_x()
     
     def is_x_too_small(self, x):
-        return x < 0
+        return x < self.matrix.min_x
     
     def is_y_too_big(self, y):
-        return y >= self.matrix.height
+        return y > self.matrix.max_y()
     
     def is_y_too_small(self, y):
-        return y < 0
+        return y < self.matrix.min_y
 
     def set(self, item):
         self.matrix.set(self.current_x, self.current_y, item)
 
-    def get(self):
-        return self.matrix.get(self.current_x, self.current_y)
+    def get(self):
+        return self.matrix.get(self.current_x, self.current_y)
+
+def get_hydrogen_length(hydrogen_amount):
+    return min(hydrogen_amount, 2)
+
+def get_coal_x_coordinates(hydrogen_amounts):
+    coal_x_coordinates = []
+    x = 0
+
+    for hydrogen_amount in hydrogen_amounts:
+        coal_x_coordinates.append(x)
+        # coal, hydrogen with its subscript and " -- " bond to the next coal
+        x += 1 + get_hydrogen_length(hydrogen_amount) + 4
+
+    return coal_x_coordinates
+
+def get_chain_length(hydrogen_amounts, coal_x_coordinates):
+    return coal_x_coordinates[-1] + get_hydrogen_length(hydrogen_amounts[-1]) + 1
+
+def measure_compound(hydrogen_amounts, coal_x_coordinates, coal_indexed_placed_groups):
+    min_x = 0
+    max_x = get_chain_length(hydrogen_amounts, coal_x_coordinates) - 1
+
+    min_y = 0
+    max_y = 0
+
+    for coal_x, placed_groups in zip(coal_x_coordinates, coal_indexed_placed_groups):
+        if placed_groups:
+            left, right, lower, upper = measure_placed_groups(coal_x, placed_groups)
+
+            min_x = min(min_x, left)
+            max_x = max(max_x, right)
+            min_y = min(min_y, lower)
+            max_y = max(max_y, upper)
 
-class MainGroupInterpreter:
-    def __init__(self, main_group_items) -> None:
-        self.main_group_items = main_group_items
+    return min_x, max_x, min_y, max_y
 
-    def get_coal_amount(self):
-        return alkane_prefix_to_coal_amount(self.get_main_alkane())
-    
-    def get_main_alkane(self):
-        return self.main_group_items[0]
+def measure_placed_groups(coal_x, placed_groups):
+    min_x = max_x = coal_x
+    min_y = max_y = 0
 
-    def get_alkane_suffix(self):
-        return self.main_group_items[2]
-    
-    def get_coal_index_of_alkane_bond(self):
-        return int(self.main_group_items[1])
+    for group, direction, offset in placed_groups:
+        left, right, lower, upper = get_stamp(group, direction).bounds
+        stamp_y = DIRECTION_STEPS[direction] * offset
 
-    def get_bond_type(self):
-        return get_bond(self.get_alkane_suffix())
-    
-    def get_hydroxyl_group_index(self):
-        return int(self.main_group_items[3])
+        min_x = min(min_x, coal_x + left)
+        max_x = max(max_x, coal_x + right)
+        min_y = min(min_y, stamp_y + lower)
+        max_y = max(max_y, stamp_y + upper)
 
-    def has_hydroxyl_group(self):
-        return len(self.main_group_items) == 5 and self.main_group_items[4] == "ol"
+    return min_x, max_x, min_y, max_y
 
 class CoalChainBuilder:
-    def __init__(self, hydrogen_amounts_list) -> None:
-        self.matrix = Matrix(1, 1, " ")
+    def __init__(self, hydrogen_amounts_list, coal_x_coordinates, coal_indexed_placed_groups, matrix_class=Matrix, lead_cells=b"", tail_cells=b"") -> None:
+        self.hydrogen_amounts_list = hydrogen_amounts_list
+        # bonds to the bands before and after, when a long chain is wrapped
+        self.lead_cells = lead_cells
+        self.tail_cells = tail_cells
 
-        self.matrix_iterator = MatrixIterator(self.matrix, 0, 0)
+        min_x, max_x, min_y, max_y = measure_compound(hydrogen_amounts_list, coal_x_coordinates, coal_indexed_placed_groups)
+        max_x = max(max_x, get_chain_length(hydrogen_amounts_list, coal_x_coordinates) + len(tail_cells) - 1)
 
-        self.hydrogen_amounts_list = hydrogen_amounts_list
-       
-        self.coal_x_coordinates = []
+        self.matrix = matrix_class(max_y - min_y + 1, max_x - min_x + 1, BLANK_CODE, min_x, min_y)
+
+        self.coal_x_coordinates = coal_x_coordinates
+        self.coal_y = 0
 
     def build(self):
-        for index, hydrogen_amount in enumerate(self.hydrogen_amounts_list):
-            self.set(COAL)
-            self.set_current_coordinates_as_coal_coordinates()
-            
-            self.build_hydrogen(hydrogen_amount)
-
-            if index != len(self.hydrogen_amounts_list) - 1:
-                self.build_bonds()
-
-        return self.matrix, self.coal_x_coordinates, self.matrix_iterator.current_y
-
-    def build_hydrogen(self, hydrogen_amount):
-        if hydrogen_amount == 1:
-            self.move_right()
-            self.set(HYDROGEN)
-        elif hydrogen_amount >= 2:
-            self.move_right()
-            self.set(HYDROGEN)
-            self.move_right()
-
-            match(hydrogen_amount):
-                case 2:
-                    self.set(SUBSCRIPT_2)
-                case 3:
-                    self.set(SUBSCRIPT_3)        
-
-    def build_bonds(self):
-        self.move_right()
-        self.move_right()
-        self.set(SINGLE_BOND)
-        self.move_right()
-        self.set(SINGLE_BOND)
-        self.move_right()
-        self.move_right()        
-
-    def set_current_coordinates_as_coal_coordinates(self):
-        self.coal_x_coordinates.append(self.matrix_iterator.current_x)
+        # the whole chain is one row of cells, written at once
+        self.matrix.write(0, self.coal_y, self.create_chain_cells())
 
-    def move_right(self):
-        self.matrix_iterator.move_right()
+        return self.matrix, self.coal_x_coordinates, self.coal_y
 
-    def set(self, item):
-        self.matrix_iterator.set(item)
+    def create_chain_cells(self):
+        return get_chain_cells(self.hydrogen_amounts_list, self.lead_cells, self.tail_cells)
+
+def get_chain_cells(hydrogen_amounts, lead_cells=b"", tail_cells=b""):
+    return lead_cells + CHAIN_BOND_CELLS.join(COAL_CELLS + get_hydrogen_cells(hydrogen_amount) for hydrogen_amount in hydrogen_amounts) + tail_cells
 
 class CoalChainIterator:
     def __init__(self, matrix, coal_x_coordinates, coal_y) -> None:
@@ -349,112 +1265,111 @@ class CoalChainIterator:
         self.matrix_iterator.move_right()
 
     def move_left(self):
-        if self.matrix_iterator.is_x_too_small(self.matrix_iterator.current_x - 1):
-            self.increase_x_coordinates()
-
         self.matrix_iterator.move_left()
 
     def move_up(self):
         self.matrix_iterator.move_up()
 
     def move_down(self):
-        if self.matrix_iterator.is_y_too_small(self.matrix_iterator.current_y - 1):
-            self.coal_y += 1
-
         self.matrix_iterator.move_down()
 
-    def increase_x_coordinates(self):
-        for i in range(len(self.coal_x_coordinates)):
-            self.coal_x_coordinates[i] += 1
-
 class BasicGroupsInterpreter:
     def __init__(self, basic_groups) -> None:
         self.basic_groups = basic_groups
 
 def add_alkane_group_up(mover: CoalChainIterator, alkane_group):
-    coal_amount = alkane_group_to_coal_amount(alkane_group)
+    coal_amount = GROUP_COAL_AMOUNTS[alkane_group]
     
     for _ in range(coal_amount - 1):
         mover.move_up()
-        mover.set("|")
+        mover.set(VERTICAL_BOND_CODE)
         mover.move_up()
 
-        mover.set("C")
+        mover.set(COAL_CODE)
         mover.move_right()
-        mover.set("H")
+        mover.set(HYDROGEN_CODE)
         mover.move_right()
-        mover.set(SUBSCRIPT_2)
+        mover.set(SUBSCRIPT_CODES[2])
         mover.move_left()
         mover.move_left()
 
     mover.move_up()
-    mover.set("|")
+    mover.set(VERTICAL_BOND_CODE)
     mover.move_up()
 
-    mover.set("C")
+    mover.set(COAL_CODE)
     mover.move_right()
-    mover.set("H")
+    mover.set(HYDROGEN_CODE)
     mover.move_right()
-    mover.set(SUBSCRIPT_3)
+    mover.set(SUBSCRIPT_CODES[3])
 
 def add_alkane_group_down(mover: CoalChainIterator, alkane_group):
-    coal_amount = alkane_group_to_coal_amount(alkane_group)
+    coal_amount = GROUP_COAL_AMOUNTS[alkane_group]
     
     for _ in range(coal_amount - 1):
         mover.move_down()
-        mover.set("|")
+        mover.set(VERTICAL_BOND_CODE)
         mover.move_down()
 
-        mover.set("C")
+        mover.set(COAL_CODE)
         mover.move_right()
-        mover.set("H")
+        mover.set(HYDROGEN_CODE)
         mover.move_right()
-        mover.set(SUBSCRIPT_2)
+        mover.set(SUBSCRIPT_CODES[2])
         mover.move_left()
         mover.move_left()
 
     mover.move_down()
-    mover.set("|")
+    mover.set(VERTICAL_BOND_CODE)
     mover.move_down()
 
-    mover.set("C")
+    mover.set(COAL_CODE)
     mover.move_right()
-    mover.set("H")
+    mover.set(HYDROGEN_CODE)
     mover.move_right()
-    mover.set(SUBSCRIPT_3)
+    mover.set(SUBSCRIPT_CODES[3])
+
+def add_alkane_group_left(mover: CoalChainIterator, alkane_group):
+    # the branch continues the row of the chain, written as the chain is
+    coal_amount = GROUP_COAL_AMOUNTS[alkane_group]
+    add_group_left(mover, "H" + SUBSCRIPT_3 + "C" + (" -- CH" + SUBSCRIPT_2) * (coal_amount - 1))
+
+def add_alkane_group_right(mover: CoalChainIterator, alkane_group):
+    coal_amount = GROUP_COAL_AMOUNTS[alkane_group]
+    add_group_right(mover, ("CH" + SUBSCRIPT_2 + " -- ") * (coal_amount - 1) + "CH" + SUBSCRIPT_3)
 
 
 
 
 def add_group_up(mover: CoalChainIterator, group):
     mover.move_up()
-    mover.set("|")
+    mover.set(VERTICAL_BOND_CODE)
     mover.move_up()
 
-    for char in group:
-        mover.set(char)
+    for code in encode_glyphs(group):
+        mover.set(code)
         mover.move_right()
 
 def add_group_down(mover: CoalChainIterator, group):
     mover.move_down()
-    mover.set("|")
+    mover.set(VERTICAL_BOND_CODE)
     mover.move_down()
 
-    for char in group:
-        mover.set(char)
+    for code in encode_glyphs(group):
+        mover.set(code)
         mover.move_right()
 
 def add_group_left(mover: CoalChainIterator, group):
     mover.move_left()
     mover.move_left()
-    mover.set("-")
+    mover.set(SINGLE_BOND_CODE)
     mover.move_left()
-    mover.set("-")
+    mover.set(SINGLE_BOND_CODE)
     mover.move_left()
     mover.move_left()
 
-    for char in group[::-1]:
-        mover.set(char)
+    for code in encode_glyphs(group)[::-1]:
+        mover.set(code)
         mover.move_left()
 
 def add_group_right(mover: CoalChainIterator, group):
@@ -462,18 +1377,18 @@ def add_group_right(mover: CoalChainIterator, group):
     mover.move_right()
     mover.move_right()
     mover.move_right()
-    mover.set("-")
+    mover.set(SINGLE_BOND_CODE)
     mover.move_right()
-    mover.set("-")
+    mover.set(SINGLE_BOND_CODE)
     mover.move_right()
     mover.move_right()
 
-    for char in group:
-        mover.set(char)
+    for code in encode_glyphs(group):
+        mover.set(code)
         mover.move_right()
 
 def add_element_in_direction(mover, group, direction):
-    symbol = get_symbol(group)
+    symbol = ELEMENTS[GROUP_ATOMS[group]]
 
     match(direction):
         case "up":
@@ -491,6 +1406,10 @@ def add_alkane_group_in_direction(mover, group, direction):
             add_alkane_group_up(mover, group)
         case "down":
             add_alkane_group_down(mover, group)
+        case "right":
+            add_alkane_group_right(mover, group)
+        case "left":
+            add_alkane_group_left(mover, group)
 
 def add_hydroxyl_group(mover, direction):
     match(direction):
@@ -503,19 +1422,74 @@ def add_hydroxyl_group(mover, direction):
         case "left":
             add_group_left(mover, "OH")
 
-def to_coal_indexed_lists_of_groups(basic_group_items, coal_amount):
-    numbers_lists = basic_group_items[::2]
-    group_names = basic_group_items[1::2]
+class Stamp:
+    # A substituent drawn once on a scratch matrix and kept as runs of
+    # non-empty cells, so drawing it again is one slice write per run.
+
+    def __init__(self, runs, bounds) -> None:
+        self.runs = runs
+        self.bounds = bounds
+        # the runs as bitmaps for the occupancy index
+        self.masks = [(run_x, run_y, (1 << len(cells)) - 1) for run_x, run_y, cells in runs]
+
+    def draw(self, matrix: Matrix, x, y):
+        for run_x, run_y, cells in self.runs:
+            matrix.write(x + run_x, y + run_y, cells)
+
+    def erase(self, matrix: Matrix, x, y):
+        for run_x, run_y, cells in self.runs:
+            matrix.erase(x + run_x, y + run_y, len(cells))
+
+def compile_stamp(group, direction):
+    scratch = Matrix(1, 1, BLANK_CODE)
+    mover = MatrixIterator(scratch)
+    direction_name = DIRECTIONS[direction]
+
+    if is_element_group(group):
+        add_element_in_direction(mover, group, direction_name)
+    elif group == HYDROXYL_GROUP:
+        add_hydroxyl_group(mover, direction_name)
+    else:
+        add_alkane_group_in_direction(mover, group, direction_name)
+
+    # the coal itself is never part of a substituent
+    scratch.set(0, 0, scratch.default_item)
 
-    numbers_lists = [[int(char) for char in numbers.split(',')] for numbers in numbers_lists]
+    runs = []
 
+    for y in range(scratch.min_y, scratch.max_y() + 1):
+        cells = bytearray()
+
+        for x in range(scratch.min_x, scratch.max_x() + 2):
+            item = scratch.get(x, y) if x <= scratch.max_x() else scratch.default_item
+
+            if item != scratch.default_item:
+                cells.append(item)
+            elif cells:
+                runs.append((x - len(cells), y, bytes(cells)))
+                cells = bytearray()
+
+    # the bounds keep every cell the cursor visited, as the matrix did
+    bounds = scratch.min_x, scratch.max_x(), scratch.min_y, scratch.max_y()
+
+    return Stamp(runs, bounds)
+
+# indexed by group code and direction code, compiled up front so the
+# first drawing of a group does not pay for its scratch matrix
+STAMPS = [compile_stamp(group, direction) for group in range(len(GROUP_NAMES)) for direction in range(len(DIRECTIONS))]
+
+def get_stamp(group, direction):
+    return STAMPS[group * len(DIRECTIONS) + direction]
+
+def to_coal_indexed_lists_of_groups(substituents, coal_amount):
     coal_indexed_groups = [[] for _ in range(coal_amount)]
 
-    for numbers, group in zip(numbers_lists, group_names):
-        group = remove_quantitative_prefix(group)
+    for substituent in substituents:
+        for locant in substituent.locants:
+            if not 1 <= locant <= coal_amount:
+                wrong_coal_index_of_group_error()
 
-        for number in numbers:
-            coal_indexed_groups[number - 1].append(group)
+            coal_indexed_groups[locant - 1].append(substituent.group)
 
     return coal_indexed_groups
 
@@ -524,10 +1498,10 @@ def add_bonds(coal_chain_iterator: CoalChainIterator, bond_type, bond_index):
 
     coal_chain_iterator.move_right()
 
-    if coal_chain_iterator.get() == HYDROGEN:
+    if coal_chain_iterator.get() == HYDROGEN_CODE:
         coal_chain_iterator.move_right()
 
-        if coal_chain_iterator.get() != " ":
+        if coal_chain_iterator.get() != BLANK_CODE:
             coal_chain_iterator.move_right()
 
     coal_chain_iterator.move_right()
@@ -538,6 +1512,9 @@ def add_bonds(coal_chain_iterator: CoalChainIterator, bond_type, bond_index):
 def wrong_coal_index_of_bond_error():
     raise ValueError("The entered compound name has coal index of bond which is out of range!")
 
+def wrong_coal_index_of_group_error():
+    raise ValueError("The entered compound name has coal index of group which is out of range!")
+
 def more_than_4_coal_connections_error():
     raise ValueError("The entered compound name contains a coal which has more than 4 connections with other elements!")
 
@@ -548,76 +1525,1233 @@ def are_all_numbers_positive_or_equal_to_zero(numbers):
     
     return True
 
-def interprate_compound_name(compound_name):
-    splitter = CompoundNameSplitter(compound_name)
+def no_free_place_for_group_error():
+    raise ValueError("The entered compound name contains a group which has no free place in the drawing!")
 
-    basic_group_items, main_group_items = splitter.split()
+def get_coal_directions(coal_index, coal_amount):
+    directions = [UP, DOWN]
 
-    main_group_interpreter = MainGroupInterpreter(main_group_items)
+    if coal_index == 0:
+        directions.append(LEFT)
 
-    coal_amount = main_group_interpreter.get_coal_amount()
+    if coal_index == coal_amount - 1:
+        directions.append(RIGHT)
 
-    coal_indexed_groups = to_coal_indexed_lists_of_groups(basic_group_items, coal_amount)
-    
-    if main_group_interpreter.has_hydroxyl_group():
-        hydroxyl_group_index = main_group_interpreter.get_hydroxyl_group_index()
-        coal_indexed_groups[hydroxyl_group_index - 1].append("ol")
+    return directions
 
-    hydrogen_amounts = [2 for _ in range(coal_amount)]
-    hydrogen_amounts[0] = 3
-    hydrogen_amounts[-1] = 3
+class OccupancyIndex:
+    # Drawn cells as one integer bitmap per row, bit i standing for column
+    # i - origin_x, so testing a run of cells is a single mask and the cost
+    # of a placement depends on the group, never on the rest of the canvas.
 
-    for i, groups in enumerate(coal_indexed_groups):
-        hydrogen_amounts[i] -= len(groups) 
+    def __init__(self) -> None:
+        self.rows = {}
+        self.origin_x = 0
 
-    bond_index = main_group_interpreter.get_coal_index_of_alkane_bond() - 1
-    bond_type = main_group_interpreter.get_bond_type()
+        self.min_y = 0
+        self.max_y = 0
 
-    if not 0 <= bond_index < len(hydrogen_amounts):
-        wrong_coal_index_of_bond_error()
+    def get_height(self):
+        return self.max_y - self.min_y + 1
 
-    if bond_type == DOUBLE_BOND:
-        hydrogen_amounts[bond_index] -= 1
-        hydrogen_amounts[bond_index + 1] -= 1
-    elif bond_type == TRIPLE_BOND:
-        hydrogen_amounts[bond_index] -= 2
-        hydrogen_amounts[bond_index + 1] -= 2
+    def make_room(self, x):
+        missing = -(x + self.origin_x)
 
-    if not are_all_numbers_positive_or_equal_to_zero(hydrogen_amounts):
-        more_than_4_coal_connections_error()
+        if missing > 0:
+            self.rows = {y: row << missing for y, row in self.rows.items()}
+            self.origin_x += missing
+
+    def occupy(self, x, y, length):
+        self.make_room(x)
+        self.rows[y] = self.rows.get(y, 0) | ((1 << length) - 1) << (x + self.origin_x)
+
+        self.min_y = min(self.min_y, y)
+        self.max_y = max(self.max_y, y)
+
+    def can_place(self, stamp: Stamp, direction, offset, x, y):
+        # a longer bond is a stem of vertical bonds between coal and group
+        self.make_room(x + stamp.bounds[0])
+
+        rows = self.rows
+        index = x + self.origin_x
+        step = DIRECTION_STEPS[direction]
+
+        for distance in range(1, offset + 1):
+            if rows.get(y + step * distance, 0) >> index & 1:
+                return False
+
+        stamp_y = y + step * offset
+
+        for run_x, run_y, mask in stamp.masks:
+            if rows.get(stamp_y + run_y, 0) & mask << (index + run_x):
+                return False
+
+        return True
+
+    def place(self, stamp: Stamp, direction, offset, x, y):
+        self.make_room(x + stamp.bounds[0])
+
+        rows = self.rows
+        index = x + self.origin_x
+        step = DIRECTION_STEPS[direction]
+
+        for distance in range(1, offset + 1):
+            rows[y + step * distance] = rows.get(y + step * distance, 0) | 1 << index
+
+        stamp_y = y + step * offset
+
+        for run_x, run_y, mask in stamp.masks:
+            rows[stamp_y + run_y] = rows.get(stamp_y + run_y, 0) | mask << (index + run_x)
+
+        # the stem lies between the coal and the stamp, inside these rows
+        self.min_y = min(self.min_y, stamp_y + stamp.bounds[2])
+        self.max_y = max(self.max_y, stamp_y + stamp.bounds[3])
+
+    def remove(self, stamp: Stamp, direction, offset, x, y):
+        rows = self.rows
+        index = x + self.origin_x
+        step = DIRECTION_STEPS[direction]
+
+        for distance in range(1, offset + 1):
+            rows[y + step * distance] &= ~(1 << index)
+
+        stamp_y = y + step * offset
+
+        for run_x, run_y, mask in stamp.masks:
+            rows[stamp_y + run_y] &= ~(mask << (index + run_x))
+
+    def insert_columns(self, x, amount):
+        self.make_room(x)
+        index = x + self.origin_x
+        lower_mask = (1 << index) - 1
+
+        self.rows = {y: row & lower_mask | (row >> index) << (index + amount) for y, row in self.rows.items()}
 
-    matrix, coal_x_coordinates, coal_y = CoalChainBuilder(hydrogen_amounts).build()
+    def remove_columns(self, x, amount):
+        self.make_room(x)
+        index = x + self.origin_x
+        lower_mask = (1 << index) - 1
+
+        self.rows = {y: row & lower_mask | (row >> (index + amount)) << index for y, row in self.rows.items()}
+
+def find_free_place(occupancy_index: OccupancyIndex, group, directions, coal_x, coal_y):
+    # Moving a group past every occupied row always frees it, so longer
+    # bonds are tried only up to the height of the drawing.
+    for offset in range(occupancy_index.get_height() + 1):
+        for direction in directions:
+            if offset and not DIRECTION_STEPS[direction]:
+                continue
+
+            if occupancy_index.can_place(get_stamp(group, direction), direction, offset, coal_x, coal_y):
+                return direction, offset
+
+    no_free_place_for_group_error()
+
+def place_coal_groups(occupancy_index: OccupancyIndex, groups, directions, coal_x, coal_y):
+    directions = list(directions)
+    placed_groups = []
+
+    for group in groups:
+        direction, offset = find_free_place(occupancy_index, group, directions, coal_x, coal_y)
+
+        occupancy_index.place(get_stamp(group, direction), direction, offset, coal_x, coal_y)
+        directions.remove(direction)
+        placed_groups.append((group, direction, offset))
+
+    return placed_groups
+
+def get_default_placement(coal_indexed_groups, coal_x_coordinates, first_coal_index, coal_amount):
+    # The groups in the directions of their coals in order, which is where
+    # the occupancy index puts them when no two stamps on the same side of
+    # the chain share a column. None when some of them might.
+    last_columns = [None for _ in DIRECTIONS]
+    coal_indexed_placed_groups = []
+
+    for coal_index, (coal_x, groups) in enumerate(zip(coal_x_coordinates, coal_indexed_groups), first_coal_index):
+        directions = get_coal_directions(coal_index, coal_amount)
+
+        if len(groups) > len(directions):
+            return None
+
+        for group, direction in zip(groups, directions):
+            bounds = get_stamp(group, direction).bounds
+            last_column = last_columns[direction]
+
+            if last_column is not None and coal_x + bounds[0] <= last_column:
+                return None
+
+            last_columns[direction] = coal_x + bounds[1]
+
+        coal_indexed_placed_groups.append([(group, direction, 0) for group, direction in zip(groups, directions)])
+
+    return coal_indexed_placed_groups
+
+def place_groups(coal_indexed_groups, hydrogen_amounts, coal_x_coordinates, coal_y=0, occupancy_index=None, first_coal_index=0, coal_amount=None):
+    # Every group takes the first direction of its coal with free cells,
+    # and when none is free it is moved away from the chain on a longer bond.
+    # A band of a long chain passes where it starts in the whole chain.
+    if coal_amount is None:
+        coal_amount = len(coal_indexed_groups)
+
+    # the index is only needed when the stamps might collide, or when the
+    # caller keeps it
+    if occupancy_index is None:
+        coal_indexed_placed_groups = get_default_placement(coal_indexed_groups, coal_x_coordinates, first_coal_index, coal_amount)
+
+        if coal_indexed_placed_groups is not None:
+            return coal_indexed_placed_groups
+
+        occupancy_index = OccupancyIndex()
+
+    occupancy_index.occupy(0, coal_y, get_chain_length(hydrogen_amounts, coal_x_coordinates))
+
+    return [
+        place_coal_groups(occupancy_index, groups, get_coal_directions(coal_index, coal_amount), coal_x, coal_y)
+        for coal_index, (coal_x, groups) in enumerate(zip(coal_x_coordinates, coal_indexed_groups), first_coal_index)
+    ]
+
+def is_default_placement(placed_groups, directions):
+    # the groups took the directions of the coal in order, as if nothing
+    # else had been drawn
+    return all(offset == 0 and direction == directions[index] for index, (group, direction, offset) in enumerate(placed_groups))
+
+def draw_molecule(molecule: Molecule, matrix_class=Matrix):
+    if molecule.coal_amount > CHAIN_BAND_COAL_AMOUNT:
+        return draw_wrapped_molecule(molecule, matrix_class=matrix_class)
+
+    profile = render_profile
+
+    if profile is not None:
+        profile.start()
+
+    hydrogen_amounts = molecule.get_chain_hydrogen_amounts()
+    coal_x_coordinates = get_coal_x_coordinates(hydrogen_amounts)
+    coal_indexed_placed_groups = place_groups(molecule.coal_indexed_groups, hydrogen_amounts, coal_x_coordinates)
+
+    if profile is not None:
+        profile.end_phase("place")
+
+    return draw_layout(hydrogen_amounts, molecule.get_chain_bond_orders(), coal_x_coordinates, coal_indexed_placed_groups, matrix_class)
+
+def draw_layout(hydrogen_amounts, bond_orders, coal_x_coordinates, coal_indexed_placed_groups, matrix_class=Matrix, lead_cells=b"", tail_cells=b""):
+    # matrix_class is Matrix or another canvas with its interface, such as
+    # NumpyMatrix from numpy_matrix
+    profile = render_profile
+
+    matrix, coal_x_coordinates, coal_y = CoalChainBuilder(hydrogen_amounts, coal_x_coordinates, coal_indexed_placed_groups, matrix_class, lead_cells, tail_cells).build()
     coal_chain_iterator = CoalChainIterator(matrix, coal_x_coordinates, coal_y)
 
-    add_bonds(coal_chain_iterator, bond_type, bond_index)
-    coal_chain_iterator.reset()
+    if profile is not None:
+        profile.end_phase("chain")
+
+    for bond_index, bond_order in enumerate(bond_orders):
+        if bond_order != 1:
+            add_bonds(coal_chain_iterator, ORDERS_AND_BOND_CODES[bond_order], bond_index)
+
+    if profile is not None:
+        profile.end_phase("bonds")
 
     # attaching groups to comopound 
-    for coal_index, groups in enumerate(coal_indexed_groups):
-        directions = ["up", "down"]
-
-        if coal_index == 0:
-            directions.append("left")
-        elif coal_index == len(coal_indexed_groups) - 1:
-            directions.append("right")
-
-        for group in groups:
-            direction = directions[0]
-            directions.pop(0)
-
-            if is_element(group):
-                add_element_in_direction(coal_chain_iterator, group, direction)
-            elif group.startswith("ol"):
-                add_hydroxyl_group(coal_chain_iterator, direction)
+    for coal_x, placed_groups in zip(coal_x_coordinates, coal_indexed_placed_groups):
+        for group, direction, offset in placed_groups:
+            draw_placed_group(matrix, group, direction, offset, coal_x, coal_y)
+
+    if profile is not None:
+        profile.end_phase("groups")
+
+        # only the last band of a wrapped chain finishes the compound
+        if not tail_cells:
+            profile.count("compounds")
+
+    return matrix
+
+def get_chain_bands(coal_amount, band_coal_amount=CHAIN_BAND_COAL_AMOUNT):
+    return [(start, min(start + band_coal_amount, coal_amount)) for start in range(0, coal_amount, band_coal_amount)]
+
+def get_wrapped_bond_cells(bond_order):
+    # the bond between two bands, split into the end of the upper band and
+    # the start of the lower one
+    bond_code = ORDERS_AND_BOND_CODES[bond_order]
+    return bytes((BLANK_CODE, bond_code, bond_code)), bytes((bond_code, bond_code, BLANK_CODE))
+
+def get_band_bond_cells(molecule: Molecule, start, end):
+    # the halves of the bonds to the bands before and after
+    lead_cells = tail_cells = b""
+
+    if start > 0:
+        lead_cells = get_wrapped_bond_cells(molecule.bond_orders[start - 1])[1]
+
+    if end < molecule.coal_amount:
+        tail_cells = get_wrapped_bond_cells(molecule.bond_orders[end - 1])[0]
+
+    return lead_cells, tail_cells
+
+def get_band_coal_x_coordinates(hydrogen_amounts, first_coal_x):
+    return [first_coal_x + coal_x for coal_x in get_coal_x_coordinates(hydrogen_amounts)]
+
+def layout_chain_band(molecule: Molecule, start, end):
+    # Coals start to end of the main chain laid out on their own, so a band
+    # costs the same wherever it is in the chain.
+    hydrogen_amounts = molecule.hydrogen_amounts[start:end]
+    bond_orders = molecule.bond_orders[start:(end - 1)]
+    lead_cells, tail_cells = get_band_bond_cells(molecule, start, end)
+
+    coal_x_coordinates = get_band_coal_x_coordinates(hydrogen_amounts, len(lead_cells))
+    coal_indexed_placed_groups = place_groups(molecule.coal_indexed_groups[start:end], hydrogen_amounts, coal_x_coordinates, 0, None, start, molecule.coal_amount)
+
+    return hydrogen_amounts, bond_orders, coal_x_coordinates, coal_indexed_placed_groups, lead_cells, tail_cells
+
+def draw_chain_band(molecule: Molecule, start, end, matrix_class=Matrix):
+    profile = render_profile
+
+    if profile is not None:
+        profile.start()
+
+    hydrogen_amounts, bond_orders, coal_x_coordinates, coal_indexed_placed_groups, lead_cells, tail_cells = layout_chain_band(molecule, start, end)
+
+    if profile is not None:
+        profile.end_phase("place")
+
+    return draw_layout(hydrogen_amounts, bond_orders, coal_x_coordinates, coal_indexed_placed_groups, matrix_class, lead_cells, tail_cells)
+
+def iter_molecule_rows(molecule: Molecule, band_coal_amount=CHAIN_BAND_COAL_AMOUNT, matrix_class=Matrix):
+    # The rows of a long chain, band after band with an empty row between
+    # them. Only one band is held at a time.
+    for index, (start, end) in enumerate(get_chain_bands(molecule.coal_amount, band_coal_amount)):
+        if index:
+            yield ""
+
+        yield from draw_chain_band(molecule, start, end, matrix_class).render().split("\n")
+
+def draw_wrapped_molecule(molecule: Molecule, band_coal_amount=CHAIN_BAND_COAL_AMOUNT, matrix_class=Matrix):
+    # bands stacked into one matrix, as wide as the widest band
+    rows = [encode_glyphs(row) for row in iter_molecule_rows(molecule, band_coal_amount, matrix_class)]
+    matrix = matrix_class(len(rows), max(len(row) for row in rows), BLANK_CODE)
+
+    for y, row in enumerate(rows):
+        if row:
+            matrix.write(0, y, row)
+
+    return matrix
+
+def draw_placed_group(matrix: Matrix, group, direction, offset, coal_x, coal_y):
+    step = DIRECTION_STEPS[direction]
+
+    for distance in range(1, offset + 1):
+        matrix.set(coal_x, coal_y + step * distance, VERTICAL_BOND_CODE)
+
+    get_stamp(group, direction).draw(matrix, coal_x, coal_y + step * offset)
+
+def erase_placed_group(matrix: Matrix, group, direction, offset, coal_x, coal_y):
+    step = DIRECTION_STEPS[direction]
+
+    for distance in range(1, offset + 1):
+        matrix.erase(coal_x, coal_y + step * distance, 1)
+
+    get_stamp(group, direction).erase(matrix, coal_x, coal_y + step * offset)
+
+def get_hydrogen_cells(hydrogen_amount):
+    if hydrogen_amount == 0:
+        return b""
+
+    if hydrogen_amount == 1:
+        return bytes((HYDROGEN_CODE,))
+
+    return bytes((HYDROGEN_CODE, SUBSCRIPT_CODES[hydrogen_amount]))
+
+def get_matrix_bounds(matrix: Matrix):
+    return matrix.min_x, matrix.max_x(), matrix.min_y, matrix.max_y()
+
+class IncrementalBand:
+    # Coals start to end of the chain drawn as draw_chain_band draws them,
+    # kept with their layout and occupancy index. An edit erases, places and
+    # draws only the coals it touched, and when a coal gets shorter or
+    # longer the columns after it are moved instead of drawing the rest of
+    # the band again. The band is drawn from scratch when a group could not
+    # take its usual place.
+
+    def __init__(self, start, end) -> None:
+        self.start = start
+        self.end = end
+
+        self.matrix = None
+        self.occupancy_index = None
+        self.hydrogen_amounts = None
+        self.bond_orders = None
+        self.coal_x_coordinates = None
+        self.coal_indexed_placed_groups = None
+        self.lead_cells = b""
+        self.tail_cells = b""
+        self.coal_amount = 0
+        self.is_default_layout = False
+        self.coal_y = 0
+
+        # bounds of the groups of every coal, x relative to the coal
+        self.lefts = None
+        self.rights = None
+        self.lowers = None
+        self.uppers = None
+
+    def can_update(self):
+        # groups moved out of the way depend on everything drawn before them
+        return self.matrix is not None and self.is_default_layout
+
+    def get_directions(self, coal):
+        return get_coal_directions(self.start + coal, self.coal_amount)
+
+    def draw_all(self, molecule: Molecule):
+        start, end = self.start, self.end
+        hydrogen_amounts = molecule.hydrogen_amounts[start:end]
+        bond_orders = molecule.bond_orders[start:(end - 1)]
+        coal_indexed_groups = molecule.coal_indexed_groups[start:end]
+        lead_cells, tail_cells = get_band_bond_cells(molecule, start, end)
+
+        coal_x_coordinates = get_band_coal_x_coordinates(hydrogen_amounts, len(lead_cells))
+        occupancy_index = OccupancyIndex()
+        coal_indexed_placed_groups = place_groups(coal_indexed_groups, hydrogen_amounts, coal_x_coordinates, self.coal_y, occupancy_index, start, molecule.coal_amount)
+
+        if render_profile is not None:
+            render_profile.end_phase("place")
+
+        self.matrix = draw_layout(hydrogen_amounts, bond_orders, coal_x_coordinates, coal_indexed_placed_groups, Matrix, lead_cells, tail_cells)
+        self.occupancy_index = occupancy_index
+        self.lead_cells = lead_cells
+        self.tail_cells = tail_cells
+        self.coal_amount = molecule.coal_amount
+        self.is_default_layout = all(
+            is_default_placement(placed_groups, self.get_directions(coal))
+            for coal, placed_groups in enumerate(coal_indexed_placed_groups)
+        )
+
+        self.lefts, self.rights, self.lowers, self.uppers = (
+            list(bounds) for bounds in zip(*(measure_placed_groups(0, placed_groups) for placed_groups in coal_indexed_placed_groups))
+        )
+
+        self.keep(hydrogen_amounts, bond_orders, coal_x_coordinates, coal_indexed_placed_groups)
+
+    def keep(self, hydrogen_amounts, bond_orders, coal_x_coordinates, coal_indexed_placed_groups):
+        self.hydrogen_amounts = hydrogen_amounts
+        self.bond_orders = bond_orders
+        self.coal_x_coordinates = coal_x_coordinates
+        self.coal_indexed_placed_groups = coal_indexed_placed_groups
+
+    def update(self, molecule: Molecule, changed_coals, changed_bonds):
+        # Coals and bonds are indexes in the band, bonds to other bands are
+        # never among them. Returns False when the band has to be drawn from
+        # scratch, the matrix may be half changed by then.
+        start, end = self.start, self.end
+        hydrogen_amounts = molecule.hydrogen_amounts[start:end]
+        bond_orders = molecule.bond_orders[start:(end - 1)]
+        matrix = self.matrix
+        occupancy_index = self.occupancy_index
+        coal_y = self.coal_y
+
+        # every old group goes before any new one is placed, a new group
+        # may take cells another one has just left
+        for coal in changed_coals:
+            for group, direction, offset in self.coal_indexed_placed_groups[coal]:
+                erase_placed_group(matrix, group, direction, offset, self.coal_x_coordinates[coal], coal_y)
+                occupancy_index.remove(get_stamp(group, direction), direction, offset, self.coal_x_coordinates[coal], coal_y)
+
+        # from the right, so the old coordinates of the coals still to
+        # move stay valid
+        for coal in reversed(changed_coals):
+            if not self.move_columns(coal, hydrogen_amounts[coal]):
+                return False
+
+        coal_x_coordinates = get_band_coal_x_coordinates(hydrogen_amounts, len(self.lead_cells))
+        coal_indexed_placed_groups = list(self.coal_indexed_placed_groups)
+
+        occupancy_index.occupy(0, coal_y, get_chain_length(hydrogen_amounts, coal_x_coordinates))
+
+        for coal in changed_coals:
+            directions = self.get_directions(coal)
+            placed_groups = place_coal_groups(occupancy_index, molecule.coal_indexed_groups[start + coal], directions, coal_x_coordinates[coal], coal_y)
+
+            if not is_default_placement(placed_groups, directions):
+                return False
+
+            coal_indexed_placed_groups[coal] = placed_groups
+            self.lefts[coal], self.rights[coal], self.lowers[coal], self.uppers[coal] = measure_placed_groups(0, placed_groups)
+
+        # the groups may reach further or less far than before, the matrix
+        # takes the bounds a drawing from scratch would have
+        matrix.set_bounds(*self.measure(hydrogen_amounts, coal_x_coordinates))
+
+        for coal in changed_coals:
+            coal_x = coal_x_coordinates[coal]
+
+            matrix.write(coal_x + 1, coal_y, get_hydrogen_cells(hydrogen_amounts[coal]))
+
+            for group, direction, offset in coal_indexed_placed_groups[coal]:
+                draw_placed_group(matrix, group, direction, offset, coal_x, coal_y)
+
+        for bond_index in changed_bonds:
+            bond_x = coal_x_coordinates[bond_index] + get_hydrogen_length(hydrogen_amounts[bond_index]) + 2
+            matrix.write(bond_x, coal_y, bytes((ORDERS_AND_BOND_CODES[bond_orders[bond_index]],)) * 2)
+
+        self.keep(hydrogen_amounts, bond_orders, coal_x_coordinates, coal_indexed_placed_groups)
+
+        return True
+
+    def measure(self, hydrogen_amounts, coal_x_coordinates):
+        # the same bounds as CoalChainBuilder, from the kept bounds per coal
+        return (
+            min(0, min(map(add, coal_x_coordinates, self.lefts))),
+            max(get_chain_length(hydrogen_amounts, coal_x_coordinates) + len(self.tail_cells) - 1, max(map(add, coal_x_coordinates, self.rights))),
+            min(self.lowers),
+            max(self.uppers)
+        )
+
+    def move_columns(self, coal, hydrogen_amount):
+        # The columns right after the hydrogens of the coal only hold the
+        # chain, unless a group of another coal reaches them, and then the
+        # layout is left to a drawing from scratch.
+        old_length = get_hydrogen_length(self.hydrogen_amounts[coal])
+        length_change = get_hydrogen_length(hydrogen_amount) - old_length
+
+        if not length_change:
+            return True
+
+        matrix = self.matrix
+        x = self.coal_x_coordinates[coal] + 1 + old_length + min(length_change, 0)
+        last_x = x + max(-length_change, 1) - 1
+
+        for min_y, max_y in ((matrix.min_y, self.coal_y - 1), (self.coal_y + 1, matrix.max_y())):
+            if min_y <= max_y and not matrix.is_area_empty(x, last_x, min_y, max_y):
+                return False
+
+        if length_change > 0:
+            matrix.insert_columns(x, length_change)
+            self.occupancy_index.insert_columns(x, length_change)
+        else:
+            matrix.remove_columns(x, -length_change)
+            self.occupancy_index.remove_columns(x, -length_change)
+
+        return True
+
+    def get_rows(self):
+        # the rows as draw_wrapped_molecule stacks them
+        return [encode_glyphs(row) for row in self.matrix.render().split("\n")]
+
+def get_coal_groups(parsed_compound):
+    # the groups of the coals which have any, in the order MoleculeBuilder
+    # gives them, without a list for every coal of the chain
+    coal_groups = {}
+
+    for substituent in parsed_compound.substituents:
+        for locant in substituent.locants:
+            coal_groups.setdefault(locant - 1, []).append(substituent.group)
+
+    if parsed_compound.has_hydroxyl_group():
+        coal_groups.setdefault(parsed_compound.get_hydroxyl_group_index() - 1, []).append(HYDROXYL_GROUP)
+
+    return coal_groups
+
+def get_multiple_bond(parsed_compound):
+    # the index and order of the alkane bond, None for a single bond
+    bond_type = parsed_compound.get_bond_type()
+
+    if bond_type == SINGLE_BOND:
+        return None
+
+    return parsed_compound.get_coal_index_of_alkane_bond() - 1, BONDS_AND_ORDERS[bond_type]
+
+class IncrementalRenderer:
+    # Keeps the last drawing band by band, a chain of up to
+    # CHAIN_BAND_COAL_AMOUNT coals being a single band. The coals and bonds
+    # a new name changes are found from its groups and bond against the
+    # previous ones, so the length of the chain doesn't matter. Only the
+    # bands holding them are updated, and both bands around a changed bond
+    # between them are drawn again. Everything is drawn from scratch when
+    # the chain length changes. The returned matrix is reused, so it
+    # changes with the next call.
+
+    def __init__(self) -> None:
+        self.matrix = None
+        self.bands = []
+        self.coal_amount = 0
+        self.coal_groups = None
+        self.multiple_bond = None
+
+        # rows of every band in the matrix of a wrapped chain
+        self.band_ys = []
+        self.band_heights = []
+        self.band_lengths = []
+
+        self.full_draws = 0
+        self.partial_draws = 0
+        self.redrawn_bands = 0
+        self.redrawn_coals = 0
+
+    def draw(self, compound_name):
+        return self.draw_parsed_compound(parse_compound_name(compound_name))
+
+    def draw_parsed_compound(self, parsed_compound):
+        molecule = build_parsed_molecule(parsed_compound)
+        coal_groups = get_coal_groups(parsed_compound)
+        multiple_bond = get_multiple_bond(parsed_compound)
+        profile = render_profile
+
+        if profile is not None:
+            profile.start()
+
+        if self.matrix is None or molecule.coal_amount != self.coal_amount:
+            self.draw_all(molecule)
+            self.full_draws += 1
+        else:
+            changed_coals, changed_bonds = self.find_changes(coal_groups, multiple_bond)
+
+            if self.update(molecule, changed_coals, changed_bonds):
+                self.partial_draws += 1
+            else:
+                self.full_draws += 1
+
+            if profile is not None:
+                profile.end_phase("update")
+
+        self.coal_groups = coal_groups
+        self.multiple_bond = multiple_bond
+
+        return self.matrix
+
+    def find_changes(self, coal_groups, multiple_bond):
+        changed_coals = {coal for coal in self.coal_groups.keys() | coal_groups.keys() if self.coal_groups.get(coal) != coal_groups.get(coal)}
+        changed_bonds = set()
+
+        if multiple_bond != self.multiple_bond:
+            # a multiple bond takes hydrogens from both of its coals
+            for bond in (self.multiple_bond, multiple_bond):
+                if bond is not None:
+                    changed_coals.update((bond[0], bond[0] + 1))
+                    changed_bonds.add(bond[0])
+
+        return changed_coals, changed_bonds
+
+    def draw_all(self, molecule: Molecule):
+        self.coal_amount = molecule.coal_amount
+        self.bands = [IncrementalBand(start, end) for start, end in get_chain_bands(molecule.coal_amount)]
+
+        for band in self.bands:
+            band.draw_all(molecule)
+
+        if len(self.bands) == 1:
+            self.matrix = self.bands[0].matrix
+        else:
+            self.stack()
+
+    def update(self, molecule: Molecule, changed_coals, changed_bonds):
+        # Returns False when the only band was drawn from scratch.
+        band_coals = {}
+        redrawn_bands = set()
+
+        for coal in sorted(changed_coals):
+            band_coals.setdefault(coal // CHAIN_BAND_COAL_AMOUNT, []).append(coal % CHAIN_BAND_COAL_AMOUNT)
+
+        for bond_index in changed_bonds:
+            band_index, coal = divmod(bond_index, CHAIN_BAND_COAL_AMOUNT)
+
+            # a bond to the next band is drawn in both of them
+            if coal == CHAIN_BAND_COAL_AMOUNT - 1:
+                redrawn_bands.update((band_index, band_index + 1))
+
+        for band_index, coals in band_coals.items():
+            band = self.bands[band_index]
+            bonds = [bond_index - band.start for bond_index in changed_bonds if band.start <= bond_index < band.end - 1]
+
+            if band_index in redrawn_bands or not band.can_update() or not band.update(molecule, coals, bonds):
+                band.draw_all(molecule)
+                redrawn_bands.add(band_index)
             else:
-                add_alkane_group_in_direction(coal_chain_iterator, group, direction)
+                self.redrawn_coals += len(coals)
+
+        self.redrawn_bands += len(redrawn_bands)
+
+        # a last band drawn from scratch has counted the compound already
+        if render_profile is not None and len(self.bands) - 1 not in redrawn_bands:
+            render_profile.count("compounds")
+
+        if len(self.bands) == 1:
+            self.matrix = self.bands[0].matrix
+
+            return not redrawn_bands
+
+        self.restack(band_coals.keys())
+
+        return True
+
+    def stack(self):
+        # bands one under another with an empty row between them, as wide
+        # as the widest band, as draw_wrapped_molecule does
+        band_rows = [band.get_rows() for band in self.bands]
+
+        self.band_heights = [len(rows) for rows in band_rows]
+        self.band_lengths = [max(len(row) for row in rows) for rows in band_rows]
+        self.band_ys = list(accumulate((height + 1 for height in self.band_heights[:-1]), initial=0))
+
+        self.matrix = Matrix(sum(self.band_heights) + len(self.bands) - 1, max(self.band_lengths), BLANK_CODE)
+
+        for band_y, rows in zip(self.band_ys, band_rows):
+            for y, row in enumerate(rows, band_y):
+                self.matrix.write(0, y, row)
+
+    def restack(self, band_indexes):
+        # The rows of the changed bands are written over their old rows.
+        # A band with another height moves the bands under it, then the
+        # rows are stacked again, without laying out any band.
+        band_rows = {band_index: self.bands[band_index].get_rows() for band_index in band_indexes}
+
+        if any(len(rows) != self.band_heights[band_index] for band_index, rows in band_rows.items()):
+            self.stack()
+            return
+
+        matrix = self.matrix
+
+        for band_index, rows in band_rows.items():
+            self.band_lengths[band_index] = max(len(row) for row in rows)
+
+        length = max(self.band_lengths)
+        matrix.set_bounds(0, max(length, matrix.length) - 1, 0, matrix.height - 1)
+
+        for band_index, rows in band_rows.items():
+            for y, row in enumerate(rows, self.band_ys[band_index]):
+                matrix.erase(0, y, matrix.length)
+                matrix.write(0, y, row)
 
-            coal_chain_iterator.move_to_current_coal()
+        matrix.set_bounds(0, length - 1, 0, matrix.height - 1)
 
-        coal_chain_iterator.move_to_next_coal()
+    def get_stats(self):
+        return {
+            "full_draws": self.full_draws,
+            "partial_draws": self.partial_draws,
+            "redrawn_bands": self.redrawn_bands,
+            "redrawn_coals": self.redrawn_coals
+        }
+
+def create_matrix_from_rows(rows, default_item=BLANK_CODE):
+    matrix = Matrix(len(rows), max((len(row) for row in rows), default=0), default_item)
+
+    for y, row in enumerate(rows):
+        matrix.write(0, y, encode_glyphs(row).rstrip(bytes((default_item,))))
+
+    return matrix
+
+def interprate_compound_name(compound_name):
+    if persistent_render_cache is None:
+        return draw_molecule(build_molecule(compound_name))
+
+    # the name as written is looked up first, so stored names skip parsing,
+    # and another spelling is found by its canonical name
+    key = normalize_compound_name(compound_name)
+    rows = persistent_render_cache.get(key)
+
+    if rows is not None:
+        return create_matrix_from_rows(rows)
+
+    parsed_compound = parse_compound_name(compound_name)
+    canonical_name = get_canonical_name(parsed_compound)
+
+    if canonical_name != key:
+        rows = persistent_render_cache.get(canonical_name, count=False)
+
+        if rows is not None:
+            return create_matrix_from_rows(rows)
+
+    return draw_and_store(parsed_compound, canonical_name)
+
+def draw_parsed_compound(parsed_compound, canonical_name):
+    # the persistent cache keeps renders under canonical names only
+    if persistent_render_cache is None:
+        return draw_molecule(build_parsed_molecule(parsed_compound))
+
+    rows = persistent_render_cache.get(canonical_name)
+
+    if rows is not None:
+        return create_matrix_from_rows(rows)
+
+    return draw_and_store(parsed_compound, canonical_name)
+
+def draw_and_store(parsed_compound, canonical_name):
+    matrix = draw_molecule(build_parsed_molecule(parsed_compound))
+    persistent_render_cache.put(canonical_name, matrix.to_rows())
 
     return matrix
 
+def normalize_compound_name(compound_name):
+    return "".join(compound_name.split())
+
+class RenderCache:
+    # Renders are kept under canonical names, other spellings of a name are
+    # aliases to its canonical name kept apart, so they never take the place
+    # of a render.
+
+    def __init__(self, max_size=1024) -> None:
+        self.max_size = max_size
+        self.renders = OrderedDict()
+        self.aliases = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, count=True):
+        if key in self.aliases:
+            self.aliases.move_to_end(key)
+            key = self.aliases[key]
+
+        render = self.renders.get(key)
+
+        if render is None:
+            if count:
+                self.misses += 1
+
+            return None
+
+        self.renders.move_to_end(key)
+
+        if count:
+            self.hits += 1
+
+        return render
+
+    def put(self, key, render):
+        self.renders[key] = render
+        self.renders.move_to_end(key)
+
+        while len(self.renders) > self.max_size:
+            self.renders.popitem(last=False)
+            self.evictions += 1
+
+    def put_alias(self, alias, key):
+        self.aliases[alias] = key
+        self.aliases.move_to_end(alias)
+
+        while len(self.aliases) > self.max_size:
+            self.aliases.popitem(last=False)
+
+    def clear(self):
+        self.renders.clear()
+        self.aliases.clear()
+
+    def get_stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self.renders),
+            "aliases": len(self.aliases),
+            "max_size": self.max_size
+        }
+
+render_cache = RenderCache()
+
+def render_compound_name(compound_name, cache=render_cache):
+    # the name as written is looked up first, so exact repeats skip parsing,
+    # and a new spelling of a known compound is found by its canonical name
+    key = normalize_compound_name(compound_name)
+    rows = cache.get(key)
+
+    if rows is not None:
+        return rows
+
+    # a call which has to parse the name is one miss, even when the render
+    # is then found by the canonical name
+    parsed_compound = parse_compound_name(key)
+    canonical_name = get_canonical_name(parsed_compound)
+
+    if canonical_name != key:
+        rows = cache.get(canonical_name, count=False)
+        cache.put_alias(key, canonical_name)
+
+    if rows is None:
+        rows = draw_parsed_compound(parsed_compound, canonical_name).to_rows()
+        cache.put(canonical_name, rows)
+
+    return rows
+
+class PersistentRenderCache:
+    # Renders kept in a SQLite file shared by processes. WAL journaling lets
+    # readers work while one process writes and the busy timeout makes
+    # concurrent writers wait instead of failing. Every process opens its
+    # own connection, also after a fork.
+    #
+    # A hit only notes when the render was used, the notes are written
+    # together every touch_interval hits and with every put, so readers
+    # don't queue up for the write lock. Triggers keep the number of rows
+    # in render_count, and every put drops the least recently used renders
+    # past max_entries in the same transaction, whichever process wrote
+    # them.
+
+    def __init__(self, path, max_entries=100000, builder_version=BUILDER_VERSION, touch_interval=100) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.builder_version = builder_version
+        self.touch_interval = touch_interval
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writes = 0
+
+        # names and when they were last read, not written yet
+        self.touches = {}
+
+        self.connection = None
+        self.connection_pid = None
+
+        self.get_connection()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["connection"] = None
+        state["connection_pid"] = None
+        state["touches"] = {}
+
+        return state
+
+    def get_connection(self):
+        if self.connection is None or self.connection_pid != getpid():
+            self.connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self.connection_pid = getpid()
+            # notes of the parent process are written by the parent
+            self.touches = {}
+
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+
+            with self.transaction():
+                self.create_tables()
+
+        return self.connection
+
+    def create_tables(self):
+        connection = self.connection
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS renders ("
+            "name TEXT NOT NULL, version TEXT NOT NULL, render TEXT NOT NULL, last_used REAL NOT NULL, "
+            "PRIMARY KEY (name, version))"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS renders_last_used ON renders (last_used)")
+
+        # counting the rows of the table would read all of them
+        connection.execute("CREATE TABLE IF NOT EXISTS render_count (entries INTEGER NOT NULL)")
+        connection.execute("INSERT INTO render_count SELECT COUNT(*) FROM renders WHERE NOT EXISTS (SELECT * FROM render_count)")
+        connection.execute(
+            "CREATE TRIGGER IF NOT EXISTS renders_insert AFTER INSERT ON renders "
+            "BEGIN UPDATE render_count SET entries = entries + 1; END"
+        )
+        connection.execute(
+            "CREATE TRIGGER IF NOT EXISTS renders_delete AFTER DELETE ON renders "
+            "BEGIN UPDATE render_count SET entries = entries - 1; END"
+        )
+
+    @contextmanager
+    def transaction(self):
+        # the write lock is taken at once, so the transaction never has to
+        # be retried when another process writes first
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE")
+
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+        connection.execute("COMMIT")
+
+    def get(self, key, count=True):
+        connection = self.get_connection()
+        found = connection.execute(
+            "SELECT render FROM renders WHERE name = ? AND version = ?", (key, self.builder_version)
+        ).fetchone()
+
+        if found is None:
+            if count:
+                self.misses += 1
+
+            return None
+
+        self.touches[key] = time()
+
+        if len(self.touches) >= self.touch_interval:
+            with self.transaction():
+                self.write_touches()
+
+        if count:
+            self.hits += 1
+
+        return tuple(found[0].split("\n"))
+
+    def write_touches(self):
+        self.connection.executemany(
+            "UPDATE renders SET last_used = ? WHERE name = ? AND version = ?",
+            [(last_used, key, self.builder_version) for key, last_used in self.touches.items()]
+        )
+        self.touches.clear()
+
+    def put(self, key, render):
+        self.get_connection()
+
+        # an update keeps the row, so the count stays right
+        with self.transaction() as connection:
+            connection.execute(
+                "INSERT INTO renders (name, version, render, last_used) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (name, version) DO UPDATE SET render = excluded.render, last_used = excluded.last_used",
+                (key, self.builder_version, "\n".join(render), time())
+            )
+            self.write_touches()
+            self.evict()
+
+        self.writes += 1
+
+    def evict(self):
+        connection = self.connection
+        entries = connection.execute("SELECT entries FROM render_count").fetchone()[0]
+
+        if entries <= self.max_entries:
+            return
+
+        deleted = connection.execute(
+            "DELETE FROM renders WHERE rowid IN (SELECT rowid FROM renders ORDER BY last_used LIMIT ?)",
+            (entries - self.max_entries,)
+        ).rowcount
+        self.evictions += deleted
+
+    def clear(self):
+        self.get_connection()
+        self.touches.clear()
+
+        with self.transaction() as connection:
+            connection.execute("DELETE FROM renders")
+
+    def close(self):
+        if self.connection is not None and self.connection_pid == getpid():
+            if self.touches:
+                with self.transaction():
+                    self.write_touches()
+
+            self.connection.close()
+
+        self.connection = None
+
+    def get_stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": self.get_connection().execute("SELECT entries FROM render_count").fetchone()[0],
+            "max_size": self.max_entries
+        }
+
+persistent_render_cache = None
+
+def enable_persistent_render_cache(path, max_entries=100000):
+    # Consulted by interprate_compound_name before parsing. Enable it before
+    # creating a pool so forked workers share the same file.
+    global persistent_render_cache
+
+    persistent_render_cache = PersistentRenderCache(path, max_entries)
+
+    return persistent_render_cache
+
+def disable_persistent_render_cache():
+    global persistent_render_cache
+
+    if persistent_render_cache is not None:
+        persistent_render_cache.close()
+
+    persistent_render_cache = None
+
+RENDER_ERRORS = (ValueError,)
+
+class RenderResult:
+    def __init__(self, compound_name, matrix=None, error=None) -> None:
+        self.compound_name = compound_name
+        self.matrix = matrix
+        self.error = error
+
+    def is_ok(self):
+        return self.error is None
+
+def render_one(compound_name):
+    try:
+        return RenderResult(compound_name, matrix=interprate_compound_name(compound_name))
+    except RENDER_ERRORS as error:
+        return RenderResult(compound_name, error=error)
+
+def parse_for_batch(compound_name):
+    # the canonical name keys the batch, the compound as written is drawn
+    try:
+        parsed_compound = parse_compound_name(compound_name)
+        return get_canonical_name(parsed_compound), parsed_compound
+    except RENDER_ERRORS as error:
+        return None, error
+
+def draw_for_batch(canonical_name, parsed_compound):
+    try:
+        return RenderResult(canonical_name, matrix=draw_parsed_compound(parsed_compound, canonical_name))
+    except RENDER_ERRORS as error:
+        return RenderResult(canonical_name, error=error)
+
+def get_chunk_size(names_amount, workers):
+    # a few chunks per worker keeps the pool balanced without paying ipc per name
+    return max(1, names_amount // (workers * 4))
+
+def map_in_pool(pool, function, items, workers):
+    # in the pool when there is one, with the profiles of the workers merged
+    if pool is None:
+        return [function(*item) for item in items]
+
+    chunk_size = get_chunk_size(len(items), workers)
+
+    if render_profile is None:
+        return pool.starmap(function, items, chunksize=chunk_size)
+
+    results = []
+
+    for result, profile in pool.starmap(partial(run_profiled, function), items, chunksize=chunk_size):
+        render_profile.merge(profile)
+        results.append(result)
+
+    return results
+
+def render_many(names, workers=None):
+    # Names are parsed in the workers. Every compound is then drawn once,
+    # from its first name in the batch, and the names equivalent to it share
+    # the result.
+    names = list(names)
+
+    if workers is None:
+        workers = cpu_count() or 1
+
+    pool = Pool(min(workers, len(names))) if workers > 1 and len(names) > 1 else None
+
+    try:
+        parsed_names = map_in_pool(pool, parse_for_batch, [(name,) for name in names], workers)
+        first_indexes = {}
+
+        for index, (canonical_name, _) in enumerate(parsed_names):
+            if canonical_name is not None:
+                first_indexes.setdefault(canonical_name, index)
+
+        drawn = map_in_pool(pool, draw_for_batch, [parsed_names[index] for index in first_indexes.values()], workers)
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+    results = dict(zip(first_indexes, drawn))
+
+    return [
+        RenderResult(name, error=parsed) if canonical_name is None
+        else RenderResult(name, results[canonical_name].matrix, results[canonical_name].error)
+        for name, (canonical_name, parsed) in zip(names, parsed_names)
+    ]
+
+class BufferedRenderWriter:
+    # Collects renders and hands them to the stream in large writes instead
+    # of one write (and flush) per row.
+
+    def __init__(self, stream, buffer_size=1 << 16) -> None:
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self.parts = []
+        self.buffered_size = 0
+
+    def write(self, text):
+        self.parts.append(text)
+        self.buffered_size += len(text)
+
+        if self.buffered_size >= self.buffer_size:
+            self.flush()
+
+    def write_matrix(self, matrix: Matrix):
+        self.write(matrix.render() + "\n\n")
+
+    def flush(self):
+        if self.parts:
+            self.stream.write("".join(self.parts))
+            self.parts = []
+            self.buffered_size = 0
+
+        self.stream.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception_info):
+        self.flush()
+
+def format_render_result(result: RenderResult, as_json=False):
+    if not result.is_ok():
+        return json.dumps({
+            "name": result.compound_name,
+            "error": str(result.error),
+            "error_type": type(result.error).__name__
+        }, ensure_ascii=False) + "\n"
+
+    text = result.matrix.render()
+
+    if as_json:
+        return json.dumps({"name": result.compound_name, "rows": text.split("\n")}, ensure_ascii=False) + "\n"
+
+    return text + "\n\n"
+
+def render_record(compound_name, as_json=False):
+    return format_render_result(render_one(compound_name), as_json)
+
+def render_records_chunk(names, as_json=False):
+    return [render_record(name, as_json) for name in names]
+
+def iter_chunks(items, chunk_size):
+    items = iter(items)
+
+    while chunk := list(islice(items, chunk_size)):
+        yield chunk
+
+def iter_compound_names(lines):
+    for line in lines:
+        compound_name = line.strip()
+
+        if compound_name:
+            yield compound_name
+
+def get_chunk_records(pending_chunk):
+    if render_profile is None:
+        return pending_chunk.get()
+
+    records, profile = pending_chunk.get()
+    render_profile.merge(profile)
+
+    return records
+
+def render_records(names, workers=1, as_json=False, chunk_size=64):
+    # Yields formatted records in input order. With workers only a bounded
+    # window of chunks is in flight, so memory does not depend on input size.
+
+    if workers <= 1:
+        for name in names:
+            yield render_record(name, as_json)
+
+        return
+
+    render_chunk = partial(render_records_chunk, as_json=as_json)
+
+    if render_profile is not None:
+        render_chunk = partial(run_profiled, render_chunk)
+
+    with Pool(workers) as pool:
+        pending = deque()
+
+        for chunk in iter_chunks(names, chunk_size):
+            pending.append(pool.apply_async(render_chunk, (chunk,)))
+
+            if len(pending) >= workers * 2:
+                yield from get_chunk_records(pending.popleft())
+
+        while pending:
+            yield from get_chunk_records(pending.popleft())
+
 COMPOUNDS = [
     "4-bromo-1,2-dichloro-7-etylo-3,3,7-trimetylo-5,5-dipropylonon-6-yn-6-ol",
     "4-bromo-1,2-dichloro-7-etylo-3,3,7-trimetylonon-5-en-4-ol",
@@ -647,5 +2781,38 @@ def main2():
     print()
     matrix.print()   
 
+def main_stream(arguments=None):
+    parser = argparse.ArgumentParser(description="Draw compounds from newline-delimited names.")
+    parser.add_argument("input", nargs="?", help="file with one compound name per line, stdin when omitted")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="worker processes, output keeps input order")
+    parser.add_argument("--chunk-size", type=int, default=64, help="names sent to a worker at once")
+    parser.add_argument("--json", action="store_true", help="write every result as a json line")
+    parser.add_argument("--profile", action="store_true", help="print time per phase and canvas counters to stderr")
+    arguments = parser.parse_args(arguments)
+
+    input_file = open(arguments.input, encoding="utf-8") if arguments.input else sys.stdin
+
+    if not arguments.profile:
+        stream_records(input_file, arguments)
+        return
+
+    with profile_rendering() as profile:
+        stream_records(input_file, arguments)
+
+    print(profile.format_summary(), file=sys.stderr)
+
+def stream_records(input_file, arguments):
+    # a person typing names wants every drawing at once, a pipe wants throughput
+    interactive = sys.stdout.isatty()
+
+    with input_file, BufferedRenderWriter(sys.stdout) as writer:
+        names = iter_compound_names(input_file)
+
+        for record in render_records(names, arguments.workers, arguments.json, arguments.chunk_size):
+            writer.write(record)
+
+            if interactive:
+                writer.flush()
+
 if __name__ == "__main__":
-    main2()
+    main_stream()
@@ -0,0 +1,204 @@
+from functools import partial
+import argparse
+import sys
+
+import compound_builder
+from better_compound_builder import (
+    GROUP_COAL_AMOUNTS,
+    GROUP_NAMES,
+    HYDROXYL_GROUP,
+    ORDERS_AND_BONDS,
+    RENDER_ERRORS,
+    Matrix,
+    Molecule,
+    build_molecule,
+    draw_molecule,
+    get_coal_directions,
+    iter_compound_names
+)
+
+try:
+    import numpy_matrix
+except ImportError:
+    numpy_matrix = None
+
+
+# Every backend draws a Molecule built by the better_compound_builder front
+# end and returns the rows of the drawing, so names are parsed and checked
+# the same way whichever backend draws them.
+
+DEFAULT_BACKEND = "iterator"
+BACKENDS = {}
+# the legacy builder also fails with these on names it cannot draw
+BACKEND_ERRORS = RENDER_ERRORS + (KeyError, IndexError)
+
+
+def register_backend(name, draw):
+    BACKENDS[name] = draw
+
+def register_canvas_backend(name, matrix_class):
+    # a canvas with the Matrix interface, drawn by the iterator layout
+    register_backend(name, partial(draw_with_canvas, matrix_class=matrix_class))
+
+def draw_with_canvas(molecule: Molecule, matrix_class=Matrix):
+    return draw_molecule(molecule, matrix_class).render().split("\n")
+
+def draw_with_numpy(molecule: Molecule):
+    # long chains go through the block copy of the bands into one array
+    return numpy_matrix.draw_molecule_with_numpy(molecule).render().split("\n")
+
+def get_backend(name):
+    if name not in BACKENDS:
+        unknown_backend_error(name)
+
+    return BACKENDS[name]
+
+def unknown_backend_error(name):
+    raise ValueError(f"There is no builder backend called {name!r}!")
+
+def to_legacy_groups(groups):
+    return [compound_builder.HYDROXYL_GROUP if group == HYDROXYL_GROUP else GROUP_NAMES[group] for group in groups]
+
+def get_legacy_bond(molecule: Molecule):
+    # MatrixMover draws a single multiple bond, found by its locant
+    for bond_index, bond_order in enumerate(molecule.get_chain_bond_orders()):
+        if bond_order != 1:
+            return bond_index + 1, ORDERS_AND_BONDS[bond_order]
+
+    return 1, ORDERS_AND_BONDS[1]
+
+def draw_with_mover(molecule: Molecule):
+    coal_indexed_groups = [to_legacy_groups(groups) for groups in molecule.coal_indexed_groups]
+    bond_index, bond = get_legacy_bond(molecule)
+    matrix = compound_builder.draw_compound(coal_indexed_groups, bond_index, bond, molecule.get_chain_hydrogen_amounts())
+
+    return ["".join(row) for row in matrix.items]
+
+def has_alkyl_group_at_chain_end(molecule: Molecule):
+    # MatrixMover draws alkyl groups only up and down, so it leaves out the
+    # ones a chain end takes on its left or right
+    return any(GROUP_COAL_AMOUNTS[group] for groups in molecule.coal_indexed_groups for group in groups[2:])
+
+def has_group_right_of_bare_last_coal(molecule: Molecule):
+    # MatrixMover removes the empty hydrogen columns of the last coal, the
+    # iterator layout keeps them before a group on its right
+    last_coal = molecule.coal_amount - 1
+    groups = molecule.coal_indexed_groups[last_coal]
+
+    return molecule.hydrogen_amounts[last_coal] == 0 and len(groups) == len(get_coal_directions(last_coal, molecule.coal_amount))
+
+register_backend("mover", draw_with_mover)
+register_canvas_backend("iterator", Matrix)
+
+# the numpy canvas only when numpy is installed
+if numpy_matrix is not None:
+    register_backend("numpy", draw_with_numpy)
+
+# Drawings a backend is known to make otherwise than the reference one,
+# as tests of the molecules they concern. --parity counts them apart from
+# the differences it reports.
+EXPECTED_DIFFERENCES = {
+    "mover": [has_alkyl_group_at_chain_end, has_group_right_of_bare_last_coal]
+}
+
+def render_compound(compound_name, backend=DEFAULT_BACKEND):
+    return get_backend(backend)(build_molecule(compound_name))
+
+def normalize_rows(rows):
+    # the same drawing whatever the blank margins around it
+    rows = [row.rstrip() for row in rows]
+
+    while rows and not rows[0]:
+        rows.pop(0)
+
+    while rows and not rows[-1]:
+        rows.pop()
+
+    indent = min((len(row) - len(row.lstrip()) for row in rows if row), default=0)
+
+    return tuple(row[indent:] for row in rows)
+
+def draw_with_backends(compound_name, backends):
+    # one parse for all backends, an error stands for the drawing when the
+    # name or a backend fails
+    try:
+        molecule = build_molecule(compound_name)
+    except RENDER_ERRORS as error:
+        return {backend: type(error).__name__ for backend in backends}
+
+    drawings = {}
+
+    for backend in backends:
+        try:
+            drawings[backend] = normalize_rows(get_backend(backend)(molecule))
+        except BACKEND_ERRORS as error:
+            drawings[backend] = type(error).__name__
+
+    return drawings
+
+def is_expected_difference(compound_name, backend, expected, drawing):
+    # only drawings may differ as expected, never an error
+    if isinstance(expected, str) or isinstance(drawing, str):
+        return False
+
+    molecule = build_molecule(compound_name)
+
+    return any(test(molecule) for test in EXPECTED_DIFFERENCES.get(backend, []))
+
+def iter_parity_differences(names, backends, reference=DEFAULT_BACKEND):
+    # (name, backend, reference drawing, backend drawing, whether the
+    # difference is expected) for every drawing which differs from the
+    # reference backend
+    for compound_name in names:
+        drawings = draw_with_backends(compound_name, [reference] + [backend for backend in backends if backend != reference])
+        expected = drawings.pop(reference)
+
+        for backend, drawing in drawings.items():
+            if drawing != expected:
+                yield compound_name, backend, expected, drawing, is_expected_difference(compound_name, backend, expected, drawing)
+
+def format_drawing(drawing):
+    if isinstance(drawing, str):
+        return f"error: {drawing}"
+
+    return "\n".join(drawing)
+
+def main():
+    parser = argparse.ArgumentParser(description="Draw compounds with a chosen builder backend, or compare the backends.")
+    parser.add_argument("names", nargs="*", help="compound names, read from stdin when omitted")
+    parser.add_argument("-b", "--backend", action="append", choices=list(BACKENDS), help="backend to draw with, the default one when omitted")
+    parser.add_argument("--parity", action="store_true", help="compare the backends with the reference one instead of drawing")
+    parser.add_argument("--reference", default=DEFAULT_BACKEND, choices=list(BACKENDS))
+    arguments = parser.parse_args()
+
+    names = arguments.names or iter_compound_names(sys.stdin)
+    backends = arguments.backend or [DEFAULT_BACKEND]
+
+    if arguments.parity:
+        if not arguments.backend:
+            backends = list(BACKENDS)
+
+        names = list(names)
+        differences = 0
+        expected_differences = 0
+
+        for compound_name, backend, expected, drawing, is_expected in iter_parity_differences(names, backends, arguments.reference):
+            if is_expected:
+                expected_differences += 1
+                continue
+
+            differences += 1
+            print(f"{compound_name}\n{arguments.reference}:\n{format_drawing(expected)}\n{backend}:\n{format_drawing(drawing)}\n")
+
+        print(f"{len(names)} names, {differences} differences, {expected_differences} expected differences", file=sys.stderr)
+        sys.exit(1 if differences else 0)
+
+    for compound_name in names:
+        for backend in backends:
+            try:
+                print("\n".join(render_compound(compound_name, backend)) + "\n")
+            except BACKEND_ERRORS as error:
+                print(f"{compound_name}: {error}\n", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+from contextlib import redirect_stdout
+from io import StringIO
+from random import Random
+from time import perf_counter
+import argparse
+import json
+import platform
+import sys
+
+import compound_builder
+import better_compound_builder
+from better_compound_builder import ParsedCompound, Substituent, format_compound_name, get_multiplier
+from compound_enumerator import get_free_hydrogen_amounts
+
+try:
+    import numpy_matrix
+except ImportError:
+    numpy_matrix = None
+
+
+# groups understood by both builders
+BENCHMARK_GROUPS = ["bromo", "chloro", "metylo", "etylo", "propylo", "butylo", "pentylo"]
+SUBSTITUENT_AMOUNTS = [0, 1, 2, 4, 8]
+BATCH_SIZES = [1, 10, 100, 1000]
+# chains past the ten prefixes of compound_builder, only the new builders
+# name them
+LONG_COAL_AMOUNTS = [20, 100, better_compound_builder.MAX_COAL_AMOUNT]
+ALKANE_SUFFIXES = list(better_compound_builder.ALKANE_SUFFIXES_AND_BONDS)
+
+MAX_SAME_GROUPS = 4
+
+
+def generate_compound_name(random, coal_amount, substituent_amount, alkane_suffix, bond_locant, hydroxyl):
+    # places the groups on coals which still have a hydrogen to replace, so
+    # every generated name passes the valence check of both builders
+
+    hydrogen_amounts = get_free_hydrogen_amounts(coal_amount, alkane_suffix, bond_locant)
+    groups_and_locants = {}
+    hydroxyl_locant = None
+
+    if hydroxyl:
+        hydroxyl_coal = random.choice([coal for coal, hydrogen_amount in enumerate(hydrogen_amounts) if hydrogen_amount > 0])
+        hydrogen_amounts[hydroxyl_coal] -= 1
+        hydroxyl_locant = hydroxyl_coal + 1
+
+    for index in range(substituent_amount):
+        free_coals = [coal for coal, hydrogen_amount in enumerate(hydrogen_amounts) if hydrogen_amount > 0]
+        groups = [group for group in BENCHMARK_GROUPS if len(groups_and_locants.get(group, [])) < MAX_SAME_GROUPS]
+
+        if not free_coals or not groups:
+            break
+
+        coal = random.choice(free_coals)
+        group = groups[index % len(groups)]
+
+        hydrogen_amounts[coal] -= 1
+        groups_and_locants.setdefault(group, []).append(coal + 1)
+
+    parsed_compound = ParsedCompound()
+    parsed_compound.main_alkane = better_compound_builder.ALKANE_PREFIXES[coal_amount - 1]
+    parsed_compound.alkane_suffix = alkane_suffix
+    parsed_compound.bond_locant = bond_locant
+    parsed_compound.hydroxyl_locant = hydroxyl_locant
+
+    for group in sorted(groups_and_locants):
+        locants = sorted(groups_and_locants[group])
+        parsed_compound.substituents.append(Substituent(locants, get_multiplier(len(locants)), better_compound_builder.GROUP_CODES[group]))
+
+    return format_compound_name(parsed_compound)
+
+def generate_cases(seed=0):
+    random = Random(seed)
+    cases = []
+
+    for coal_amount in list(range(1, len(compound_builder.ALKANE_PREFIXES) + 1)) + LONG_COAL_AMOUNTS:
+        for alkane_suffix in ALKANE_SUFFIXES:
+            if alkane_suffix != "an" and coal_amount < 2:
+                continue
+
+            for hydroxyl in [False, True]:
+                for substituent_amount in SUBSTITUENT_AMOUNTS:
+                    # a double or triple bond needs the next coal as well
+                    bond_locant = 1 if alkane_suffix == "an" else random.randint(1, coal_amount - 1)
+
+                    cases.append({
+                        "coal_amount": coal_amount,
+                        "alkane_suffix": alkane_suffix,
+                        "bond_locant": bond_locant,
+                        "substituents": substituent_amount,
+                        "hydroxyl": hydroxyl,
+                        "name": generate_compound_name(random, coal_amount, substituent_amount, alkane_suffix, bond_locant, hydroxyl)
+                    })
+
+    return cases
+
+def parse_with_mover(compound_name):
+    # what compound_builder.interprate_compound_name hands to draw_compound
+    splitter = compound_builder.CompoundNameSplitter(compound_name)
+    basic_group_items, main_group_items = splitter.split()
+    main_group_interpreter = compound_builder.MainGroupInterpreter(main_group_items)
+    coal_indexed_groups = compound_builder.to_coal_indexed_lists_of_groups(basic_group_items, main_group_interpreter.get_coal_amount())
+
+    if main_group_interpreter.has_hydroxyl_group():
+        coal_indexed_groups[main_group_interpreter.get_hydroxyl_group_index() - 1].append(compound_builder.HYDROXYL_GROUP)
+
+    return coal_indexed_groups, main_group_interpreter.get_coal_index_of_alkane_bond(), main_group_interpreter.get_bond_type()
+
+def layout_with_mover(compound_name, parsed):
+    return compound_builder.draw_compound(*parsed)
+
+def parse_with_iterator(compound_name):
+    return better_compound_builder.build_molecule(compound_name)
+
+def layout_with_iterator(compound_name, molecule):
+    return better_compound_builder.draw_molecule(molecule)
+
+def layout_with_numpy(compound_name, molecule):
+    return numpy_matrix.draw_molecule_with_numpy(molecule)
+
+def print_matrix(matrix):
+    with redirect_stdout(StringIO()):
+        matrix.print()
+
+BUILDERS = {
+    "mover": (parse_with_mover, layout_with_mover),
+    "iterator": (parse_with_iterator, layout_with_iterator)
+}
+
+# the numpy canvas only when numpy is installed
+if numpy_matrix is not None:
+    BUILDERS["numpy"] = (parse_with_iterator, layout_with_numpy)
+
+def time_call(function, loops, repeats):
+    best = None
+
+    for _ in range(repeats):
+        start = perf_counter()
+
+        for _ in range(loops):
+            result = function()
+
+        elapsed = (perf_counter() - start) / loops
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best, result
+
+def benchmark_case(builder, case, loops, repeats):
+    parse, layout = BUILDERS[builder]
+    compound_name = case["name"]
+    result = dict(case, builder=builder, parse=None, layout=None, print=None, error=None)
+
+    try:
+        result["parse"], parsed = time_call(lambda: parse(compound_name), loops, repeats)
+        result["layout"], matrix = time_call(lambda: layout(compound_name, parsed), loops, repeats)
+        result["print"], _ = time_call(lambda: print_matrix(matrix), loops, repeats)
+    except Exception as error:
+        result["error"] = f"{type(error).__name__}: {error}"
+
+    return result
+
+def render_batch(builder, names):
+    parse, layout = BUILDERS[builder]
+
+    for compound_name in names:
+        print_matrix(layout(compound_name, parse(compound_name)))
+
+def benchmark_batch(builder, names, batch_size, repeats):
+    names = [names[index % len(names)] for index in range(batch_size)]
+    seconds, _ = time_call(lambda: render_batch(builder, names), 1, repeats)
+
+    return {"builder": builder, "batch_size": batch_size, "seconds": seconds}
+
+def count_errors(case_results, builders):
+    return {builder: sum(result["builder"] == builder and result["error"] is not None for result in case_results) for builder in builders}
+
+def run_benchmarks(builders, loops=20, repeats=3, seed=0):
+    cases = generate_cases(seed)
+    case_results = [benchmark_case(builder, case, loops, repeats) for builder in builders for case in cases]
+
+    # batches only take names every builder drew, so they time the same
+    # work for each builder and never an error
+    failed_names = {result["name"] for result in case_results if result["error"] is not None}
+    batch_names = [case["name"] for case in cases if case["name"] not in failed_names]
+
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "seed": seed,
+        "loops": loops,
+        "repeats": repeats,
+        "errors": count_errors(case_results, builders),
+        "cases": case_results,
+        "batch_names": len(batch_names),
+        "batches": [benchmark_batch(builder, batch_names, batch_size, repeats) for builder in builders for batch_size in BATCH_SIZES] if batch_names else []
+    }
+
+def get_drawn_names(results, builder):
+    return {result["name"] for result in results["cases"] if result["builder"] == builder and result["error"] is None}
+
+def sum_stage(results, builder, stage, names):
+    return sum(result[stage] for result in results["cases"] if result["builder"] == builder and result["name"] in names)
+
+def compare_results(old_results, new_results):
+    lines = []
+
+    for builder in BUILDERS:
+        # both versions are summed over the names both of them drew
+        names = get_drawn_names(old_results, builder) & get_drawn_names(new_results, builder)
+        old_errors = count_errors(old_results["cases"], [builder])[builder]
+        new_errors = count_errors(new_results["cases"], [builder])[builder]
+
+        for stage in ["parse", "layout", "print"]:
+            old_seconds = sum_stage(old_results, builder, stage, names)
+            new_seconds = sum_stage(new_results, builder, stage, names)
+
+            if old_seconds and new_seconds:
+                lines.append(
+                    f"{builder:>8} {stage:>6}: {old_seconds * 1e3:9.3f} ms -> {new_seconds * 1e3:9.3f} ms ({old_seconds / new_seconds:.2f}x)"
+                    f", {len(names)} names, errors {old_errors} -> {new_errors}"
+                )
+
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the parse, layout and print stages of both compound builders.")
+    parser.add_argument("-o", "--output", help="json file for the results, stdout when omitted")
+    parser.add_argument("-b", "--builder", action="append", choices=list(BUILDERS), help="builder to run, all by default")
+    parser.add_argument("--loops", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compare", metavar="OLD_JSON", help="print speedups against an earlier result file")
+    arguments = parser.parse_args()
+
+    results = run_benchmarks(arguments.builder or list(BUILDERS), arguments.loops, arguments.repeats, arguments.seed)
+
+    if arguments.output:
+        with open(arguments.output, "w", encoding="utf-8") as output_file:
+            json.dump(results, output_file, indent=1)
+    else:
+        json.dump(results, sys.stdout, indent=1)
+        print()
+
+    if arguments.compare:
+        with open(arguments.compare, encoding="utf-8") as old_file:
+            print(compare_results(json.load(old_file), results), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
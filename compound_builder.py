@@ -1,3 +1,4 @@
+from itertools import compress
 from typing import Any
 
 
@@ -13,14 +14,18 @@ TRIPLE_BOND = "\u2261"
 
 SUBSCRIPT_2 = "\u2082"
 SUBSCRIPT_3 = "\u2083"
+SUBSCRIPT_4 = "\u2084"
 
 COAL = "C"
 HYDROGEN = "H"
 
-ALKANE_GROUPS_AND_COAL_AMOUNTS = {"metylo":1, "etylo":2, "propylo":3, "butylo":4}
+ALKANE_GROUPS_AND_COAL_AMOUNTS = {"metylo":1, "etylo":2, "propylo":3, "butylo":4, "pentylo":5}
 
 ALKANE_SUFFIXES_AND_BONDS = {"an":SINGLE_BOND, "en":DOUBLE_BOND, "yn":TRIPLE_BOND}
 
+# special group hydroxyl group
+HYDROXYL_GROUP = "spc:hydroxyl"
+
 def get_symbol(group):
     return GROUPS_AND_SYMBOLS[group]
 
@@ -99,6 +104,25 @@ def remove_quantitative_prefix(segment: str) -> tuple[bool, str]:
     
     return segment
 
+def find_empty_cell_around(row, kept, x, default_item):
+    # the stored index of an empty cell now at x, x + 1 or x - 1, in that
+    # order, as remove_empty_sequence picks it; no cell left of x - 1 was
+    # removed, and a cell past the end of the row is never empty
+    indexes = []
+    index = x - 1
+
+    while len(indexes) < 3 and index < len(row):
+        if kept[index]:
+            indexes.append(index)
+
+        index += 1
+
+    for position in (1, 2, 0):
+        if position < len(indexes) and row[indexes[position]] == default_item:
+            return indexes[position]
+
+    return None
+
 class Matrix:
     def __init__(self, height, length, default_item):
         self.height = height
@@ -158,6 +182,30 @@ class Matrix:
         for row in self.items:
             row.pop(x)
 
+    def remove_empty_sequences(self, xs):
+        # remove_empty_sequence for every x from right to left. The cells
+        # removed so far lie right of x - 2, so only a few cells around x
+        # are walked in a row, and every row is rebuilt once at the end.
+        kept_cells = [bytearray(b"\x01") * len(row) for row in self.items]
+
+        for x in sorted(xs, reverse=True):
+            coordinates_to_remove = []
+
+            for row, kept in zip(self.items, kept_cells):
+                x_to_remove = find_empty_cell_around(row, kept, x, self.default_item)
+
+                if x_to_remove is None:
+                    break
+
+                coordinates_to_remove.append(x_to_remove)
+            else:
+                for kept, x_to_remove in zip(kept_cells, coordinates_to_remove):
+                    kept[x_to_remove] = 0
+
+                self.length -= 1
+
+        self.items = [list(compress(row, kept)) for row, kept in zip(self.items, kept_cells)]
+
     def add_right_column(self):
         for row in self.items:
             row.append(self.default_item)
@@ -473,11 +521,16 @@ def interprate_compound_name(compound_name):
 
     coal_indexed_groups = to_coal_indexed_lists_of_groups(basic_group_items, coal_amount)
     
-    hydroxyl_group_index = main_group_interpreter.get_hydroxyl_group_index()
     if main_group_interpreter.has_hydroxyl_group():
-        coal_indexed_groups[hydroxyl_group_index - 1].append("spc:hydroxyl") # special group hydroxyl group
+        hydroxyl_group_index = main_group_interpreter.get_hydroxyl_group_index()
+        coal_indexed_groups[hydroxyl_group_index - 1].append(HYDROXYL_GROUP)
 
+    return draw_compound(coal_indexed_groups, main_group_interpreter.get_coal_index_of_alkane_bond(), main_group_interpreter.get_bond_type())
 
+def draw_compound(coal_indexed_groups, bond_index, bond, hydrogen_amounts=None):
+    # the drawing alone, for names parsed by another front end, which may
+    # count the hydrogens of every coal as well
+    coal_amount = len(coal_indexed_groups)
     matrix, mover = create_matrix_and_mover(coal_amount)
 
 
@@ -486,7 +539,9 @@ def interprate_compound_name(compound_name):
 
         if coal_index == 0:
             directions.append("left")
-        elif coal_index == len(coal_indexed_groups) - 1:
+
+        # a lone coal has both ends
+        if coal_index == len(coal_indexed_groups) - 1:
             directions.append("right")
 
         for group in groups:
@@ -495,7 +550,7 @@ def interprate_compound_name(compound_name):
 
             if is_element(group):
                 add_element_in_direction(mover, group, direction)
-            elif group.startswith("spc:hydroxyl"):
+            elif group == HYDROXYL_GROUP:
                 add_hydroxyl_group(mover, direction)
             else:
                 add_alkane_group_in_direction(mover, group, direction)
@@ -504,12 +559,13 @@ def interprate_compound_name(compound_name):
 
         mover.move_to_next_coal()
 
-    hydrogen_amounts = [2 for _ in range(coal_amount)]
-    hydrogen_amounts[0] = 3
-    hydrogen_amounts[-1] = 3
+    if hydrogen_amounts is None:
+        hydrogen_amounts = [2 for _ in range(coal_amount)]
+        hydrogen_amounts[0] = 3
+        hydrogen_amounts[-1] = 3
 
-    for i, groups in enumerate(coal_indexed_groups):
-        hydrogen_amounts[i] -= len(groups) 
+        for i, groups in enumerate(coal_indexed_groups):
+            hydrogen_amounts[i] -= len(groups) 
 
     columns_to_remove = []
 
@@ -532,23 +588,24 @@ def interprate_compound_name(compound_name):
                 mover.set(SUBSCRIPT_2)
             case 3:
                 mover.set(SUBSCRIPT_3)
+            case 4:
+                mover.set(SUBSCRIPT_4)
+
+    # Setting bond, a single coal has none
+
+    if bond_index < coal_amount:
+        # the hydrogens left the cursor past the first coal
+        mover.move_to_current_coal()
+        mover.move_to_coal_index(bond_index)
+        mover.move_right() # H
+        mover.move_right() # 2
+        mover.move_right() # 
+        mover.move_right() # -
+        mover.set(bond)
+        mover.move_right()
+        mover.set(bond)
 
-    # Setting bond
-
-    bond_index = main_group_interpreter.get_coal_index_of_alkane_bond()
-    bond = main_group_interpreter.get_bond_type()
-
-    mover.move_to_coal_index(bond_index)
-    mover.move_right() # H
-    mover.move_right() # 2
-    mover.move_right() # 
-    mover.move_right() # -
-    mover.set(bond)
-    mover.move_right()
-    mover.set(bond)
-
-    for x in columns_to_remove:
-        matrix.remove_empty_sequence(x)
+    matrix.remove_empty_sequences(columns_to_remove)
 
     return matrix
 
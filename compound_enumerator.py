@@ -0,0 +1,141 @@
+from functools import partial
+from itertools import combinations_with_replacement
+from multiprocessing import Pool
+import argparse
+
+from better_compound_builder import (
+    ParsedCompound,
+    Substituent,
+    ALKANE_PREFIXES,
+    ALKANE_SUFFIXES_AND_BONDS,
+    ALKANE_GROUPS_AND_COAL_AMOUNTS,
+    BONDS_AND_ORDERS,
+    GROUPS_AND_SYMBOLS,
+    GROUP_CODES,
+    get_bond,
+    get_chain_hydrogen_amounts,
+    canonicalize_parsed_compound,
+    format_compound_name
+)
+
+ALL_GROUPS = sorted(list(GROUPS_AND_SYMBOLS) + list(ALKANE_GROUPS_AND_COAL_AMOUNTS))
+ALL_ALKANE_SUFFIXES = list(ALKANE_SUFFIXES_AND_BONDS)
+
+
+def iter_main_chains(max_coal_amount, alkane_suffixes):
+    for coal_amount in range(1, min(max_coal_amount, len(ALKANE_PREFIXES)) + 1):
+        for alkane_suffix in alkane_suffixes:
+            if alkane_suffix == "an":
+                bond_locants = [1]
+            else:
+                # a double or triple bond needs the next coal as well
+                bond_locants = range(1, coal_amount)
+
+            for bond_locant in bond_locants:
+                yield coal_amount, alkane_suffix, bond_locant
+
+def get_free_hydrogen_amounts(coal_amount, alkane_suffix, bond_locant):
+    hydrogen_amounts = get_chain_hydrogen_amounts(coal_amount)
+    extra_bond_order = BONDS_AND_ORDERS[get_bond(alkane_suffix)] - 1
+
+    if extra_bond_order:
+        hydrogen_amounts[bond_locant - 1] -= extra_bond_order
+        hydrogen_amounts[bond_locant] -= extra_bond_order
+
+    return hydrogen_amounts
+
+def iter_coal_choices(groups, free_hydrogen_amount, remaining_groups):
+    # every group replaces one hydrogen, so a coal never takes more groups
+    # than it has hydrogens left, which prunes all invalid branches at once
+    for group_amount in range(min(free_hydrogen_amount, remaining_groups) + 1):
+        yield from combinations_with_replacement(groups, group_amount)
+
+def iter_substitutions(free_hydrogen_amounts, groups, remaining_groups, coal=0):
+    if coal == len(free_hydrogen_amounts):
+        yield ()
+        return
+
+    for choice in iter_coal_choices(groups, free_hydrogen_amounts[coal], remaining_groups):
+        for rest in iter_substitutions(free_hydrogen_amounts, groups, remaining_groups - len(choice), coal + 1):
+            yield (choice,) + rest
+
+def create_compound_name(coal_amount, alkane_suffix, bond_locant, substitution):
+    parsed_compound = ParsedCompound()
+    parsed_compound.main_alkane = ALKANE_PREFIXES[coal_amount - 1]
+    parsed_compound.alkane_suffix = alkane_suffix
+    parsed_compound.bond_locant = bond_locant
+
+    for coal, choice in enumerate(substitution):
+        for group in choice:
+            parsed_compound.substituents.append(Substituent([coal + 1], None, GROUP_CODES[group]))
+
+    return format_compound_name(canonicalize_parsed_compound(parsed_compound))
+
+def iter_tasks(max_coal_amount, groups, alkane_suffixes, max_groups):
+    # the search space split by main chain and by the groups of the first
+    # coal, small enough pieces to spread over shards evenly
+    for coal_amount, alkane_suffix, bond_locant in iter_main_chains(max_coal_amount, alkane_suffixes):
+        free_hydrogen_amounts = get_free_hydrogen_amounts(coal_amount, alkane_suffix, bond_locant)
+
+        for first_choice in iter_coal_choices(groups, free_hydrogen_amounts[0], max_groups):
+            yield coal_amount, alkane_suffix, bond_locant, first_choice
+
+def enumerate_compound_names(max_coal_amount, groups=ALL_GROUPS, alkane_suffixes=ALL_ALKANE_SUFFIXES, max_groups=None, shard=0, shard_count=1):
+    groups = sorted(set(groups))
+
+    if max_groups is None:
+        max_groups = 4 * max_coal_amount
+
+    tasks = iter_tasks(max_coal_amount, groups, alkane_suffixes, max_groups)
+
+    for index, (coal_amount, alkane_suffix, bond_locant, first_choice) in enumerate(tasks):
+        if index % shard_count != shard:
+            continue
+
+        free_hydrogen_amounts = get_free_hydrogen_amounts(coal_amount, alkane_suffix, bond_locant)
+        rest = iter_substitutions(free_hydrogen_amounts, groups, max_groups - len(first_choice), coal=1)
+
+        for substitution in rest:
+            yield create_compound_name(coal_amount, alkane_suffix, bond_locant, (first_choice,) + substitution)
+
+def list_compound_names_shard(shard, shard_count, max_coal_amount, groups, alkane_suffixes, max_groups):
+    return list(enumerate_compound_names(max_coal_amount, groups, alkane_suffixes, max_groups, shard, shard_count))
+
+def enumerate_compound_names_parallel(max_coal_amount, groups=ALL_GROUPS, alkane_suffixes=ALL_ALKANE_SUFFIXES, max_groups=None, workers=2, shards_per_worker=4):
+    # shards finish in any order, names inside a shard keep their order
+    shard_count = workers * shards_per_worker
+    list_shard = partial(
+        list_compound_names_shard,
+        shard_count=shard_count,
+        max_coal_amount=max_coal_amount,
+        groups=groups,
+        alkane_suffixes=alkane_suffixes,
+        max_groups=max_groups
+    )
+
+    with Pool(workers) as pool:
+        for names in pool.imap_unordered(list_shard, range(shard_count)):
+            yield from names
+
+def main():
+    parser = argparse.ArgumentParser(description="Print every valid substituted chain name up to a chain length.")
+    parser.add_argument("max_coal_amount", type=int)
+    parser.add_argument("-g", "--group", action="append", choices=ALL_GROUPS, help="allowed group, all by default")
+    parser.add_argument("-s", "--suffix", action="append", choices=ALL_ALKANE_SUFFIXES, help="allowed bond suffix, all by default")
+    parser.add_argument("-m", "--max-groups", type=int, help="most groups in one name")
+    parser.add_argument("-w", "--workers", type=int, default=1)
+    arguments = parser.parse_args()
+
+    groups = arguments.group or ALL_GROUPS
+    alkane_suffixes = arguments.suffix or ALL_ALKANE_SUFFIXES
+
+    if arguments.workers > 1:
+        names = enumerate_compound_names_parallel(arguments.max_coal_amount, groups, alkane_suffixes, arguments.max_groups, arguments.workers)
+    else:
+        names = enumerate_compound_names(arguments.max_coal_amount, groups, alkane_suffixes, arguments.max_groups)
+
+    for name in names:
+        print(name)
+
+if __name__ == "__main__":
+    main()
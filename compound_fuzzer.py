@@ -0,0 +1,400 @@
+from multiprocessing import Pool
+from os import cpu_count, path
+from random import Random
+from time import perf_counter
+import argparse
+import json
+import re
+import sys
+import traceback
+
+import compound_builder
+from better_compound_builder import (
+    ALKANE_PREFIXES,
+    ALKANE_SUFFIXES_AND_BONDS,
+    BLANK_CODE,
+    CHAIN_BAND_COAL_AMOUNT,
+    DIRECTION_STEPS,
+    GROUP_CODES,
+    GROUP_NAMES,
+    ParsedCompound,
+    Substituent,
+    build_molecule,
+    draw_molecule,
+    format_compound_name,
+    get_chain_bands,
+    get_chain_cells,
+    get_multiplier,
+    get_stamp,
+    layout_chain_band,
+    profile_rendering
+)
+from compound_backends import normalize_rows
+from compound_enumerator import get_free_hydrogen_amounts
+
+FUZZ_GROUPS = GROUP_NAMES[:-1]
+# words the parsers may half know, for near-valid names
+NOISE_WORDS = ["enylo", "etyl", "metylo", "ol", "an", "en", "yn", "di", "tri", "tetra", "penta", "dek", "hekt", " "]
+LONG_CHAIN_CHANCE = 0.1
+MAX_SHORT_COAL_AMOUNT = 12
+MAX_LONG_COAL_AMOUNT = 150
+
+# limits of a drawing before it counts as a performance cliff, a wrapped
+# chain writes its cells twice, into its band and into the whole drawing
+WRITES_PER_CELL = 2
+SLOW_SECONDS = 0.05
+
+MAX_MINIMIZE_CHECKS = 400
+DEFAULT_CORPUS = "fuzz_corpus.jsonl"
+
+
+def generate_valid_name(random: Random):
+    if random.random() < LONG_CHAIN_CHANCE:
+        coal_amount = random.randint(MAX_SHORT_COAL_AMOUNT, MAX_LONG_COAL_AMOUNT)
+    else:
+        coal_amount = random.randint(1, MAX_SHORT_COAL_AMOUNT)
+
+    alkane_suffix = random.choice(list(ALKANE_SUFFIXES_AND_BONDS)) if coal_amount > 1 else "an"
+    bond_locant = random.randint(1, coal_amount - 1) if alkane_suffix != "an" else 1
+    hydrogen_amounts = get_free_hydrogen_amounts(coal_amount, alkane_suffix, bond_locant)
+
+    # a few crowded coals now and then, their groups go on longer bonds
+    free_coals = [coal for coal, hydrogen_amount in enumerate(hydrogen_amounts) if hydrogen_amount > 0]
+    groups_and_locants = {}
+
+    for _ in range(random.choice([0, 1, 2, 3, 5, 8, 16])):
+        free_coals = [coal for coal in free_coals if hydrogen_amounts[coal] > 0]
+
+        if not free_coals:
+            break
+
+        coal = random.choice(free_coals)
+        hydrogen_amounts[coal] -= 1
+        groups_and_locants.setdefault(GROUP_CODES[random.choice(FUZZ_GROUPS)], []).append(coal + 1)
+
+    parsed_compound = ParsedCompound()
+    parsed_compound.main_alkane = ALKANE_PREFIXES[coal_amount - 1]
+    parsed_compound.alkane_suffix = alkane_suffix
+    parsed_compound.bond_locant = bond_locant
+
+    # names in any order and with any multiplier are still valid
+    groups = list(groups_and_locants)
+    random.shuffle(groups)
+
+    for group in groups:
+        locants = groups_and_locants[group]
+        parsed_compound.substituents.append(Substituent(locants, get_multiplier(len(locants)) if random.random() < 0.8 else None, group))
+
+    free_coals = [coal for coal in free_coals if hydrogen_amounts[coal] > 0]
+
+    if free_coals and random.random() < 0.3:
+        parsed_compound.hydroxyl_locant = random.choice(free_coals) + 1
+
+    return format_compound_name(parsed_compound)
+
+def mutate_name(random: Random, compound_name):
+    for _ in range(random.randint(1, 3)):
+        numbers = list(re.finditer(r"\d+", compound_name))
+        position = random.randint(0, len(compound_name))
+
+        match random.randrange(6):
+            case 0 if numbers:
+                number = random.choice(numbers)
+                replacement = str(random.choice([0, int(number[0]) + 1, int(number[0]) * 10, 10 ** random.randint(1, 6)]))
+                compound_name = compound_name[:number.start()] + replacement + compound_name[number.end():]
+            case 1:
+                compound_name = compound_name[:position] + compound_name[(position + 1):]
+            case 2:
+                compound_name = compound_name[:position] + random.choice(NOISE_WORDS) + compound_name[position:]
+            case 3:
+                compound_name = compound_name[:position] + random.choice(["-", ",", ",1", "-1-"]) + compound_name[position:]
+            case 4:
+                # a substituent written twice puts more groups on its coals
+                compound_name = compound_name.split("-", 1)[0] + "-" + compound_name
+            case _:
+                compound_name = compound_name[:position]
+
+    return compound_name
+
+def generate_names(random: Random, amount, seed_names):
+    # valid names and names one to three edits away from a valid one or
+    # from a stored finding
+    names = []
+
+    for _ in range(amount):
+        if seed_names and random.random() < 0.2:
+            names.append(mutate_name(random, random.choice(seed_names)))
+        elif random.random() < 0.5:
+            names.append(generate_valid_name(random))
+        else:
+            names.append(mutate_name(random, generate_valid_name(random)))
+
+    return names
+
+def get_error_location(error):
+    frame = traceback.extract_tb(error.__traceback__)[-1]
+    return f"{path.basename(frame.filename)}:{frame.name}"
+
+def is_rejection(error):
+    # a name refused on purpose, by one of the *_error helpers, and not a
+    # ValueError of some parsing call deeper down
+    return isinstance(error, ValueError) and "error" in get_error_location(error).split(":")[1]
+
+def create_finding(builder, kind, detail):
+    return {"signature": f"{builder}:{kind}:{detail}", "builder": builder, "kind": kind}
+
+def create_crash_finding(builder, error):
+    finding = create_finding(builder, "crash", f"{type(error).__name__}:{get_error_location(error)}")
+    finding["error"] = f"{type(error).__name__}: {error}"
+
+    return finding
+
+def get_placed_group_cells(group, direction, offset, coal_x):
+    step = DIRECTION_STEPS[direction]
+    stamp_y = step * offset
+    cells = {(coal_x, step * distance) for distance in range(1, offset + 1)}
+
+    for run_x, run_y, run_cells in get_stamp(group, direction).runs:
+        cells.update((coal_x + run_x + index, stamp_y + run_y) for index in range(len(run_cells)))
+
+    return cells
+
+def find_layout_problems(molecule):
+    # The drawn cells of every band collected group by group, from the
+    # stamps themselves and not from the occupancy index which placed them.
+    problems = set()
+
+    if molecule.coal_amount > CHAIN_BAND_COAL_AMOUNT:
+        bands = get_chain_bands(molecule.coal_amount)
+    else:
+        bands = [(0, molecule.coal_amount)]
+
+    for start, end in bands:
+        hydrogen_amounts, bond_orders, coal_x_coordinates, coal_indexed_placed_groups, lead_cells, tail_cells = layout_chain_band(molecule, start, end)
+        chain_cells = get_chain_cells(hydrogen_amounts, lead_cells, tail_cells)
+        drawn_cells = {(x, 0) for x, cell in enumerate(chain_cells) if cell != BLANK_CODE}
+
+        for coal_x, placed_groups in zip(coal_x_coordinates, coal_indexed_placed_groups):
+            for group, direction, offset in placed_groups:
+                cells = get_placed_group_cells(group, direction, offset, coal_x)
+
+                # a group in a direction it has no drawing for
+                if not cells:
+                    problems.add("missing_group")
+
+                if not drawn_cells.isdisjoint(cells):
+                    problems.add("overlap")
+
+                drawn_cells |= cells
+
+    return problems
+
+def check_better_builder(compound_name):
+    findings = []
+
+    try:
+        with profile_rendering() as profile:
+            start = perf_counter()
+            molecule = build_molecule(compound_name)
+            matrix = draw_molecule(molecule)
+            seconds = perf_counter() - start
+    except Exception as error:
+        if not is_rejection(error):
+            findings.append(create_crash_finding("iterator", error))
+
+        return findings, None
+
+    counters = profile.counters
+
+    for problem in sorted(find_layout_problems(molecule)):
+        findings.append(create_finding("iterator", "layout", problem))
+
+    # the canvas is measured before drawing, so it should never grow
+    if counters["growth_events"]:
+        findings.append(create_finding("iterator", "cliff", "canvas_growth"))
+
+    if counters["cells_written"] > WRITES_PER_CELL * matrix.height * matrix.length:
+        findings.append(create_finding("iterator", "cliff", "cells_written"))
+
+    if seconds > SLOW_SECONDS:
+        findings.append(create_finding("iterator", "cliff", "slow"))
+
+    return findings, matrix.render().split("\n")
+
+def check_legacy_builder(compound_name):
+    try:
+        start = perf_counter()
+        matrix = compound_builder.interprate_compound_name(compound_name)
+        seconds = perf_counter() - start
+    except Exception as error:
+        if not is_rejection(error):
+            return [create_crash_finding("mover", error)], None
+
+        return [], None
+
+    if seconds > SLOW_SECONDS:
+        return [create_finding("mover", "cliff", "slow")], None
+
+    return [], ["".join(row) for row in matrix.items]
+
+def check_name(compound_name):
+    findings, rows = check_better_builder(compound_name)
+    legacy_findings, legacy_rows = check_legacy_builder(compound_name)
+    findings.extend(legacy_findings)
+
+    if rows is not None and legacy_rows is not None and normalize_rows(rows) != normalize_rows(legacy_rows):
+        findings.append(create_finding("mover", "mismatch", "drawing"))
+
+    return findings
+
+def fuzz_batch(seed, batch_size, seed_names):
+    # runs in a worker, names are made there from the seed so only the
+    # findings travel back
+    findings = []
+
+    for compound_name in generate_names(Random(seed), batch_size, seed_names):
+        for finding in check_name(compound_name):
+            finding["name"] = compound_name
+            findings.append(finding)
+
+    return batch_size, findings
+
+def reproduces(compound_name, signature):
+    return any(finding["signature"] == signature for finding in check_name(compound_name))
+
+def split_tokens(compound_name):
+    return re.findall(r"\d+|[^\W\d_]+|\s+|.", compound_name)
+
+def minimize_name(compound_name, signature):
+    # Drops runs of tokens, then lowers numbers, while the finding still
+    # shows up. Timings are too noisy to minimize slow names by.
+    if signature.endswith(":slow"):
+        return compound_name
+
+    tokens = split_tokens(compound_name)
+    checks = 0
+    changed = True
+
+    while changed and checks < MAX_MINIMIZE_CHECKS:
+        changed = False
+        run_length = max(1, len(tokens) // 2)
+
+        while run_length >= 1 and checks < MAX_MINIMIZE_CHECKS:
+            index = 0
+
+            while index < len(tokens) and checks < MAX_MINIMIZE_CHECKS:
+                candidate = tokens[:index] + tokens[(index + run_length):]
+                checks += 1
+
+                if candidate and reproduces("".join(candidate), signature):
+                    tokens = candidate
+                    changed = True
+                else:
+                    index += 1
+
+            run_length //= 2
+
+        for index, token in enumerate(tokens):
+            if not token.isdigit():
+                continue
+
+            for smaller in sorted({1, int(token) // 2, int(token) - 1}):
+                if 0 <= smaller < int(token) and checks < MAX_MINIMIZE_CHECKS:
+                    checks += 1
+                    candidate = tokens[:index] + [str(smaller)] + tokens[(index + 1):]
+
+                    if reproduces("".join(candidate), signature):
+                        tokens = candidate
+                        changed = True
+                        break
+
+    return "".join(tokens)
+
+def load_corpus(corpus_path):
+    if not path.exists(corpus_path):
+        return {}
+
+    with open(corpus_path, encoding="utf-8") as corpus_file:
+        entries = (json.loads(line) for line in corpus_file if line.strip())
+        return {entry["signature"]: entry for entry in entries}
+
+def save_corpus(corpus_path, corpus):
+    with open(corpus_path, "w", encoding="utf-8") as corpus_file:
+        for signature in sorted(corpus):
+            corpus_file.write(json.dumps(corpus[signature], ensure_ascii=False) + "\n")
+
+def fuzz(corpus, workers=None, batches=64, batch_size=256, seed=0, seconds=None):
+    # Returns the new findings, one per signature, minimized. Every finding
+    # already in the corpus seeds the mutations.
+    workers = workers or cpu_count() or 1
+    seed_names = [entry["name"] for entry in corpus.values()]
+    new_findings = {}
+    checked = 0
+    start = perf_counter()
+
+    with Pool(workers) as pool:
+        tasks = ((seed * batches + batch, batch_size, seed_names) for batch in range(batches))
+
+        for batch_checked, findings in pool.imap_unordered(star_fuzz_batch, tasks):
+            checked += batch_checked
+
+            for finding in findings:
+                if finding["signature"] not in corpus and finding["signature"] not in new_findings:
+                    new_findings[finding["signature"]] = finding
+
+            # leaving the pool stops the batches still running
+            if seconds is not None and perf_counter() - start > seconds:
+                break
+
+    with Pool(workers) as pool:
+        minimized_names = pool.starmap(minimize_name, [(finding["name"], signature) for signature, finding in new_findings.items()])
+
+    for finding, minimized_name in zip(new_findings.values(), minimized_names):
+        finding["minimized"] = minimized_name
+
+    return new_findings, checked, perf_counter() - start
+
+def star_fuzz_batch(task):
+    return fuzz_batch(*task)
+
+def replay_corpus(corpus):
+    # the findings which still show up with their minimized names
+    return [entry for signature, entry in corpus.items() if reproduces(entry.get("minimized", entry["name"]), signature)]
+
+def format_finding(finding):
+    return f"{finding['signature']}\n    {finding.get('minimized', finding['name'])!r}\n    from {finding['name']!r}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Fuzz both compound builders with valid and almost valid names.")
+    parser.add_argument("-w", "--workers", type=int, help="worker processes, all cpus by default")
+    parser.add_argument("-b", "--batches", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=256, help="names checked by a worker at once")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--seconds", type=float, help="stop after this long")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="json lines file with one minimized name per finding")
+    parser.add_argument("--replay", action="store_true", help="only check which stored findings still show up")
+    arguments = parser.parse_args()
+
+    corpus = load_corpus(arguments.corpus)
+
+    if arguments.replay:
+        open_findings = replay_corpus(corpus)
+
+        for entry in open_findings:
+            print(format_finding(entry))
+
+        print(f"{len(open_findings)} of {len(corpus)} findings still show up", file=sys.stderr)
+        sys.exit(1 if open_findings else 0)
+
+    new_findings, checked, seconds = fuzz(corpus, arguments.workers, arguments.batches, arguments.batch_size, arguments.seed, arguments.seconds)
+
+    for finding in new_findings.values():
+        print(format_finding(finding))
+
+    corpus.update(new_findings)
+    save_corpus(arguments.corpus, corpus)
+
+    print(f"{checked} names in {seconds:.1f} s ({checked / seconds:.0f}/s), {len(new_findings)} new findings, {len(corpus)} in the corpus", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
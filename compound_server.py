@@ -0,0 +1,309 @@
+from concurrent.futures import ProcessPoolExecutor
+from os import cpu_count
+import argparse
+import asyncio
+import json
+import socket
+import sys
+
+from better_compound_builder import (
+    RENDER_ERRORS,
+    RenderCache,
+    normalize_compound_name,
+    render_compound_name
+)
+
+# The protocol is one compound name per line from the client and one json
+# line per name back, in the order of the names, shaped like the --json
+# output of better_compound_builder.
+
+DEFAULT_PORT = 8765
+
+
+def render_response(compound_name):
+    # runs in a worker process
+    try:
+        # rows as in the --json output, without the padding on the right
+        return {"name": compound_name, "rows": [row.rstrip() for row in render_compound_name(compound_name)]}
+    except RENDER_ERRORS as error:
+        return {"name": compound_name, "error": str(error), "error_type": type(error).__name__}
+
+class RenderServer:
+    # Renders run in a process pool. Concurrent requests for the same name
+    # wait for one computation, finished drawings are kept in an LRU cache,
+    # and names waiting for a worker sit in a bounded queue: when it is
+    # full, connections stop being read until a worker frees a place, so
+    # clients are slowed down instead of the server running out of memory.
+
+    def __init__(self, workers=None, queue_size=256, pipeline_size=64, cache_size=1024) -> None:
+        self.workers = workers or cpu_count() or 1
+        self.queue_size = queue_size
+        self.pipeline_size = pipeline_size
+        self.cache = RenderCache(cache_size)
+
+        self.pool = None
+        self.queue = None
+        self.pending = {}
+        self.worker_tasks = []
+        self.connections = set()
+        self.server = None
+
+        self.requests = 0
+        self.computations = 0
+        self.coalesced = 0
+
+    async def start(self, path=None, host="127.0.0.1", port=DEFAULT_PORT):
+        self.pool = ProcessPoolExecutor(self.workers)
+        self.queue = asyncio.Queue(self.queue_size)
+        self.worker_tasks = [asyncio.create_task(self.run_worker()) for _ in range(self.workers)]
+
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self.handle_connection, path)
+        else:
+            self.server = await asyncio.start_server(self.handle_connection, host, port)
+
+        return self.server
+
+    async def serve_forever(self, path=None, host="127.0.0.1", port=DEFAULT_PORT):
+        await self.start(path, host, port)
+
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+
+            # closing a connection ends its handler, which removes it
+            for writer in list(self.connections):
+                writer.close()
+
+            await self.server.wait_closed()
+
+        for task in self.worker_tasks:
+            task.cancel()
+
+        await asyncio.gather(*self.worker_tasks, return_exceptions=True)
+
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+
+    async def render(self, compound_name):
+        self.requests += 1
+        key = normalize_compound_name(compound_name)
+        rows = self.cache.get(key)
+
+        if rows is not None:
+            return {"name": compound_name, "rows": rows}
+
+        future = self.pending.get(key)
+
+        if future is not None:
+            self.coalesced += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self.pending[key] = future
+
+            try:
+                await self.queue.put((key, future))
+            except asyncio.CancelledError:
+                del self.pending[key]
+                future.cancel()
+                raise
+
+        # one waiter going away must not cancel the others
+        response = await asyncio.shield(future)
+
+        return dict(response, name=compound_name)
+
+    async def run_worker(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            key, future = await self.queue.get()
+
+            try:
+                response = await loop.run_in_executor(self.pool, render_response, key)
+                self.computations += 1
+
+                if "rows" in response:
+                    self.cache.put(key, response["rows"])
+
+                if not future.done():
+                    future.set_result(response)
+            except Exception as error:
+                if not future.done():
+                    future.set_exception(error)
+            finally:
+                del self.pending[key]
+                self.queue.task_done()
+
+    async def handle_connection(self, reader, writer):
+        # names are read ahead of the answers up to pipeline_size, the
+        # answers are written in the order of the names
+        self.connections.add(writer)
+        responses = asyncio.Queue(self.pipeline_size)
+        write_task = asyncio.create_task(self.write_responses(responses, writer))
+
+        try:
+            while line := await reader.readline():
+                compound_name = line.decode("utf-8").strip()
+
+                if compound_name:
+                    await responses.put(asyncio.create_task(self.render(compound_name)))
+
+            await responses.put(None)
+            await write_task
+        except ConnectionError:
+            pass
+        finally:
+            write_task.cancel()
+            writer.close()
+            self.connections.discard(writer)
+
+    async def write_responses(self, responses, writer):
+        while (response := await responses.get()) is not None:
+            # waiting without awaiting the answer tells an answer cancelled
+            # with the render it shared apart from this task being cancelled
+            await asyncio.wait((response,))
+
+            if response.cancelled():
+                text = json.dumps({"error": "The rendering of the entered compound name was cancelled!", "error_type": "CancelledError"})
+            else:
+                try:
+                    text = json.dumps(response.result(), ensure_ascii=False)
+                except Exception as error:
+                    text = json.dumps({"error": str(error), "error_type": type(error).__name__})
+
+            # answers for a client which went away are dropped, so reading
+            # its last names never waits on a full queue
+            if writer.is_closing():
+                continue
+
+            writer.write(text.encode("utf-8") + b"\n")
+
+            try:
+                await writer.drain()
+            except ConnectionError:
+                writer.close()
+
+    def get_stats(self):
+        return {
+            "requests": self.requests,
+            "computations": self.computations,
+            "coalesced": self.coalesced,
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "cache": self.cache.get_stats()
+        }
+
+class RenderClient:
+    # A blocking client for RenderServer. render_many keeps at most window
+    # names unanswered, so neither side waits on a full socket buffer.
+
+    def __init__(self, path=None, host="127.0.0.1", port=DEFAULT_PORT, timeout=60, window=32) -> None:
+        if path is not None:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.settimeout(timeout)
+            self.socket.connect(path)
+        else:
+            self.socket = socket.create_connection((host, port), timeout)
+
+        self.window = window
+        self.reader = self.socket.makefile("r", encoding="utf-8")
+
+    def send(self, compound_name):
+        self.socket.sendall(normalize_line(compound_name).encode("utf-8"))
+
+    def receive(self):
+        line = self.reader.readline()
+
+        if not line:
+            connection_closed_error()
+
+        return json.loads(line)
+
+    def render(self, compound_name):
+        self.send(compound_name)
+        return self.receive()
+
+    def render_many(self, names):
+        names = [name for name in names if name.strip()]
+        responses = []
+
+        for index, compound_name in enumerate(names):
+            if index >= self.window:
+                responses.append(self.receive())
+
+            self.send(compound_name)
+
+        while len(responses) < len(names):
+            responses.append(self.receive())
+
+        return responses
+
+    def close(self):
+        self.reader.close()
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception_info):
+        self.close()
+
+def normalize_line(compound_name):
+    # a name is one line of the protocol
+    return " ".join(compound_name.split()) + "\n"
+
+def connection_closed_error():
+    raise ConnectionError("The render server closed the connection!")
+
+def format_response(response):
+    if "rows" in response:
+        return "\n".join(response["rows"]) + "\n"
+
+    return f"{response['name']}: {response['error']}\n"
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve compound drawings to local clients, or ask a server for some.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="run the server")
+    serve_parser.add_argument("-w", "--workers", type=int, help="worker processes, all cpus by default")
+    serve_parser.add_argument("--queue-size", type=int, default=256, help="names waiting for a worker before clients are slowed down")
+    serve_parser.add_argument("--cache-size", type=int, default=1024)
+
+    render_parser = subparsers.add_parser("render", help="draw names with a running server")
+    render_parser.add_argument("names", nargs="*", help="compound names, read from stdin when omitted")
+    render_parser.add_argument("--json", action="store_true", help="print the json answers")
+
+    for subparser in (serve_parser, render_parser):
+        subparser.add_argument("--socket", help="unix socket path, localhost tcp when omitted")
+        subparser.add_argument("--host", default="127.0.0.1")
+        subparser.add_argument("--port", type=int, default=DEFAULT_PORT)
+
+    arguments = parser.parse_args()
+
+    if arguments.command == "serve":
+        server = RenderServer(arguments.workers, arguments.queue_size, cache_size=arguments.cache_size)
+
+        try:
+            asyncio.run(server.serve_forever(arguments.socket, arguments.host, arguments.port))
+        except KeyboardInterrupt:
+            pass
+
+        return
+
+    names = arguments.names or [line.strip() for line in sys.stdin]
+
+    with RenderClient(arguments.socket, arguments.host, arguments.port) as client:
+        for response in client.render_many(names):
+            if arguments.json:
+                print(json.dumps(response, ensure_ascii=False))
+            else:
+                sys.stdout.write(format_response(response) + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+from time import perf_counter
+
+import numpy
+
+import better_compound_builder
+from better_compound_builder import (
+    BLANK_CODE,
+    CHAIN_BAND_COAL_AMOUNT,
+    DIRECTION_STEPS,
+    DIRECTIONS,
+    ORDERS_AND_BOND_CODES,
+    STAMPS,
+    VERTICAL_BOND_CODE,
+    Molecule,
+    build_molecule,
+    decode_glyphs,
+    get_chain_bands,
+    get_chain_cells,
+    get_chain_length,
+    get_hydrogen_length,
+    layout_chain_band,
+    measure_compound
+)
+
+
+class NumpyMatrix:
+    # The Matrix interface over one 2-D array of glyph codes. Coordinates
+    # are the same signed logical ones, storage is doubled when it runs out,
+    # and writes, trimming and column removal are array operations instead
+    # of loops over cells. Glyphs are decoded once, while rendering.
+
+    def __init__(self, height, length, default_item, min_x=0, min_y=0) -> None:
+        self.height = height
+        self.length = length
+        self.default_item = default_item
+
+        self.min_x = min_x
+        self.min_y = min_y
+
+        self.origin_x = -min_x
+        self.origin_y = -min_y
+
+        self.items = numpy.full((height, length), default_item, dtype=numpy.uint8)
+
+    def max_x(self):
+        return self.min_x + self.length - 1
+
+    def max_y(self):
+        return self.min_y + self.height - 1
+
+    def get_view(self):
+        start = self.origin_x + self.min_x
+        lower = self.origin_y + self.min_y
+
+        return self.items[lower:(lower + self.height), start:(start + self.length)]
+
+    def get_row(self, y):
+        start = self.origin_x + self.min_x
+        return self.items[y + self.origin_y, start:(start + self.length)].tobytes()
+
+    def get_rows(self):
+        return [row.tobytes() for row in self.get_view()]
+
+    def set(self, x, y, item):
+        self.items[y + self.origin_y, x + self.origin_x] = item
+
+        # the profile is looked up on the module, where profile_rendering
+        # sets it
+        if better_compound_builder.render_profile is not None:
+            better_compound_builder.render_profile.count("cells_written")
+
+    def get(self, x, y):
+        return int(self.items[y + self.origin_y, x + self.origin_x])
+
+    def write(self, x, y, cells):
+        start = x + self.origin_x
+        self.items[y + self.origin_y, start:(start + len(cells))] = numpy.frombuffer(cells, dtype=numpy.uint8)
+
+        if better_compound_builder.render_profile is not None:
+            better_compound_builder.render_profile.count("cells_written", len(cells))
+
+    def erase(self, x, y, length):
+        start = x + self.origin_x
+        self.items[y + self.origin_y, start:(start + length)] = self.default_item
+
+    def remove_column(self, x):
+        self.remove_columns(x, 1)
+
+    def insert_columns(self, x, amount):
+        index = x + self.origin_x
+
+        self.items = numpy.insert(self.items, [index] * amount, self.default_item, axis=1)
+        self.length += amount
+
+    def remove_columns(self, x, amount):
+        index = x + self.origin_x
+
+        self.items = numpy.delete(self.items, numpy.s_[index:(index + amount)], axis=1)
+        self.length -= amount
+
+    def is_area_empty(self, min_x, max_x, min_y, max_y):
+        area = self.items[(min_y + self.origin_y):(max_y + self.origin_y + 1), (min_x + self.origin_x):(max_x + self.origin_x + 1)]
+        return not (area != self.default_item).any()
+
+    def reserve(self, left, right, lower, upper):
+        height, length = self.items.shape
+        items = numpy.full((lower + height + upper, left + length + right), self.default_item, dtype=numpy.uint8)
+        items[lower:(lower + height), left:(left + length)] = self.items
+
+        self.items = items
+        self.origin_x += left
+        self.origin_y += lower
+
+    def expand_to(self, x, y):
+        # storage is at least doubled on the side that runs out of room,
+        # as in Matrix
+        if better_compound_builder.render_profile is not None and not (self.min_x <= x <= self.max_x() and self.min_y <= y <= self.max_y()):
+            better_compound_builder.render_profile.count("growth_events")
+
+        height, length = self.items.shape
+        index_x = x + self.origin_x
+        index_y = y + self.origin_y
+
+        left = max(-index_x, length) if index_x < 0 else 0
+        right = max(index_x + 1 - length, length) if index_x >= length else 0
+        lower = max(-index_y, height) if index_y < 0 else 0
+        upper = max(index_y + 1 - height, height) if index_y >= height else 0
+
+        if left or right or lower or upper:
+            self.reserve(left, right, lower, upper)
+
+        if x > self.max_x():
+            self.length = x - self.min_x + 1
+        elif x < self.min_x:
+            self.length += self.min_x - x
+            self.min_x = x
+
+        if y > self.max_y():
+            self.height = y - self.min_y + 1
+        elif y < self.min_y:
+            self.height += self.min_y - y
+            self.min_y = y
+
+    def add_right_column(self):
+        self.expand_to(self.max_x() + 1, self.min_y)
+
+    def add_left_column(self):
+        self.expand_to(self.min_x - 1, self.min_y)
+
+    def add_upper_row(self):
+        self.expand_to(self.min_x, self.max_y() + 1)
+
+    def add_lower_row(self):
+        self.expand_to(self.min_x, self.min_y - 1)
+
+    def get_row_ends(self, view):
+        # index just after the last non-empty cell of every row, 0 for
+        # empty rows
+        written = view != self.default_item
+        last_written = view.shape[1] - written[:, ::-1].argmax(axis=1)
+
+        return numpy.where(written.any(axis=1), last_written, 0)
+
+    def to_rows(self):
+        return tuple(decode_glyphs(row) for row in self.get_rows())
+
+    def render(self, encoding=None):
+        profile = better_compound_builder.render_profile
+
+        if profile is not None:
+            render_start = perf_counter()
+
+        view = self.get_view()
+        text = decode_glyphs(b"\n".join(row[:end].tobytes() for row, end in zip(view, self.get_row_ends(view).tolist())))
+
+        if profile is not None:
+            profile.add_time("render", perf_counter() - render_start)
+
+        if encoding is None:
+            return text
+
+        return text.encode(encoding)
+
+    def write_to(self, stream):
+        stream.write(self.render() + "\n")
+
+    def print(self):
+        print(self.render())
+
+def compile_stamp_cells():
+    # The cells of every stamp as three flat arrays, with where each stamp
+    # starts in them and how many cells it has, so the stamps of a whole
+    # molecule are gathered with array indexing.
+    cells_x = []
+    cells_y = []
+    codes = bytearray()
+    starts = []
+    sizes = []
+
+    for stamp in STAMPS:
+        starts.append(len(codes))
+
+        for run_x, run_y, cells in stamp.runs:
+            cells_x.extend(range(run_x, run_x + len(cells)))
+            cells_y.extend([run_y] * len(cells))
+            codes += cells
+
+        sizes.append(len(codes) - starts[-1])
+
+    return (
+        numpy.array(cells_x, dtype=numpy.intp),
+        numpy.array(cells_y, dtype=numpy.intp),
+        numpy.frombuffer(bytes(codes), dtype=numpy.uint8),
+        numpy.array(starts, dtype=numpy.intp),
+        numpy.array(sizes, dtype=numpy.intp)
+    )
+
+STAMP_CELLS_X, STAMP_CELLS_Y, STAMP_CODES, STAMP_STARTS, STAMP_SIZES = compile_stamp_cells()
+
+def get_stamp_cell_indexes(stamp_indexes):
+    # indexes into the flat stamp arrays of the cells of every stamp drawn
+    sizes = STAMP_SIZES[stamp_indexes]
+    ends = numpy.cumsum(sizes)
+
+    return numpy.arange(ends[-1]) + numpy.repeat(STAMP_STARTS[stamp_indexes] - (ends - sizes), sizes), sizes
+
+def draw_layouts_with_numpy(layouts):
+    # Laid out bands stacked into one array with an empty row between them.
+    # Each chain row is one slice write, the bonds and the cells of all
+    # stamps are one indexed write each, and only the stems of groups moved
+    # away from the chain are written one slice per group.
+    profile = better_compound_builder.render_profile
+
+    bounds = [
+        measure_band(hydrogen_amounts, coal_x_coordinates, coal_indexed_placed_groups, tail_cells)
+        for hydrogen_amounts, bond_orders, coal_x_coordinates, coal_indexed_placed_groups, lead_cells, tail_cells in layouts
+    ]
+
+    matrix = NumpyMatrix(sum(max_y - min_y + 1 for min_x, max_x, min_y, max_y in bounds) + len(bounds) - 1, max(max_x - min_x + 1 for min_x, max_x, min_y, max_y in bounds), BLANK_CODE)
+    items = matrix.items
+
+    bond_xs = []
+    bond_ys = []
+    bond_codes = []
+
+    stamp_indexes = []
+    stamp_xs = []
+    stamp_ys = []
+
+    band_y = 0
+
+    for (hydrogen_amounts, bond_orders, coal_x_coordinates, coal_indexed_placed_groups, lead_cells, tail_cells), (min_x, max_x, min_y, max_y) in zip(layouts, bounds):
+        coal_y = band_y - min_y
+        chain_cells = get_chain_cells(hydrogen_amounts, lead_cells, tail_cells)
+        items[coal_y, -min_x:(len(chain_cells) - min_x)] = numpy.frombuffer(chain_cells, dtype=numpy.uint8)
+
+        for bond_index, bond_order in enumerate(bond_orders):
+            if bond_order != 1:
+                bond_x = coal_x_coordinates[bond_index] + get_hydrogen_length(hydrogen_amounts[bond_index]) + 2 - min_x
+                bond_xs += (bond_x, bond_x + 1)
+                bond_ys += (coal_y, coal_y)
+                bond_codes += (ORDERS_AND_BOND_CODES[bond_order],) * 2
+
+        for coal_x, placed_groups in zip(coal_x_coordinates, coal_indexed_placed_groups):
+            for group, direction, offset in placed_groups:
+                stamp_y = coal_y + DIRECTION_STEPS[direction] * offset
+
+                # the stem from the coal to a moved stamp
+                if stamp_y > coal_y:
+                    items[(coal_y + 1):(stamp_y + 1), coal_x - min_x] = VERTICAL_BOND_CODE
+                elif stamp_y < coal_y:
+                    items[stamp_y:coal_y, coal_x - min_x] = VERTICAL_BOND_CODE
+
+                stamp_indexes.append(group * len(DIRECTIONS) + direction)
+                stamp_xs.append(coal_x - min_x)
+                stamp_ys.append(stamp_y)
+
+        band_y += max_y - min_y + 2
+
+    if bond_codes:
+        items[bond_ys, bond_xs] = bond_codes
+
+    if stamp_indexes:
+        cell_indexes, sizes = get_stamp_cell_indexes(numpy.array(stamp_indexes, dtype=numpy.intp))
+        cells_x = numpy.repeat(numpy.array(stamp_xs, dtype=numpy.intp), sizes) + STAMP_CELLS_X[cell_indexes]
+        cells_y = numpy.repeat(numpy.array(stamp_ys, dtype=numpy.intp), sizes) + STAMP_CELLS_Y[cell_indexes]
+        items[cells_y, cells_x] = STAMP_CODES[cell_indexes]
+
+    if profile is not None:
+        profile.count("compounds")
+
+    return matrix
+
+def measure_band(hydrogen_amounts, coal_x_coordinates, coal_indexed_placed_groups, tail_cells):
+    # the bounds CoalChainBuilder gives the matrix of the band
+    min_x, max_x, min_y, max_y = measure_compound(hydrogen_amounts, coal_x_coordinates, coal_indexed_placed_groups)
+    return min_x, max(max_x, get_chain_length(hydrogen_amounts, coal_x_coordinates) + len(tail_cells) - 1), min_y, max_y
+
+def draw_wrapped_molecule_with_numpy(molecule: Molecule, band_coal_amount=CHAIN_BAND_COAL_AMOUNT):
+    return draw_layouts_with_numpy([layout_chain_band(molecule, start, end) for start, end in get_chain_bands(molecule.coal_amount, band_coal_amount)])
+
+def draw_molecule_with_numpy(molecule: Molecule):
+    # a chain short enough for one band is laid out as draw_molecule lays
+    # it out, as a band from its first coal to its last
+    return draw_wrapped_molecule_with_numpy(molecule)
+
+def interprate_compound_name(compound_name):
+    return draw_molecule_with_numpy(build_molecule(compound_name))